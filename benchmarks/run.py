@@ -0,0 +1,193 @@
+"""Throughput and allocation benchmarks for minihass, run against the in-process
+loopback broker so that results don't depend on a network.
+
+Each benchmark is run with 1, 10, 100 and 1000 binary sensors by default. Results
+are written as JSON, one record per benchmark and entity count, so that they can be
+compared between releases. Run from the repository root::
+
+    python -m benchmarks.run --output results.json
+    python -m benchmarks.run --baseline results.json
+
+With ``--baseline``, the exit status is ``1`` if any benchmark sends more messages
+or bytes than the baseline, or is slower by more than ``--tolerance`` (a fraction)
+and by more than a millisecond.
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tracemalloc
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import conftest  # Provides the microcontroller and micropython modules on CPython
+import minihass
+from minihass.loopback import LoopbackBroker, LoopbackTransport
+
+SIZES = (1, 10, 100, 1000)
+UPDATES = 1000  # Minimum number of state updates per benchmark
+TIMING_FLOOR = 0.001  # Timing differences smaller than this are noise
+
+
+def _device(entities: int, **kwargs):
+    """Returns a connected device with ``entities`` binary sensors, and its broker."""
+    broker = LoopbackBroker()
+    transport = LoopbackTransport(broker)
+    transport.connect()
+    sensors = [minihass.BinarySensor(name=f"sensor {i}") for i in range(entities)]
+    device = minihass.Device(mqtt_client=transport, entities=sensors, **kwargs)
+    broker.reset_stats()
+    return device, broker
+
+
+def announce(entities: int):
+    device, broker = _device(entities)
+    return lambda: device.announce(force=True), broker
+
+
+def device_announce(entities: int):
+    device, broker = _device(entities, discovery="device")
+    return lambda: device.announce(force=True), broker
+
+
+def state_updates(entities: int):
+    device, broker = _device(entities)
+    rounds = max(1, UPDATES // entities)
+
+    def run():
+        for n in range(rounds):
+            value = not n % 2
+            for entity in device:
+                entity.state = value
+
+    return run, broker
+
+
+def bulk_updates(entities: int):
+    device, broker = _device(entities)
+    rounds = max(1, UPDATES // entities)
+
+    def run():
+        for n in range(rounds):
+            value = not n % 2
+            device.update_states({entity: value for entity in device})
+
+    return run, broker
+
+
+def reconnect_flush(entities: int):
+    device, broker = _device(entities)
+    transport = device.mqtt_client
+    transport.disconnect(clean=False)
+    for entity in device:
+        entity.state = True  # Queued while disconnected
+    broker.reset_stats()
+    return transport.connect, broker
+
+
+BENCHMARKS = {
+    "announce": announce,
+    "device_announce": device_announce,
+    "state_updates": state_updates,
+    "bulk_updates": bulk_updates,
+    "reconnect_flush": reconnect_flush,
+}
+
+
+def measure(benchmark: str, entities: int) -> dict:
+    """Run one benchmark twice, once timed and once traced with :mod:`tracemalloc`,
+    each with a fresh device."""
+    run, broker = BENCHMARKS[benchmark](entities)
+    start = perf_counter()
+    run()
+    seconds = perf_counter() - start
+    stats = dict(broker.stats)
+
+    run, broker = BENCHMARKS[benchmark](entities)
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    before, _ = tracemalloc.get_traced_memory()
+    run()
+    after, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "benchmark": benchmark,
+        "entities": entities,
+        "messages": stats["published"],
+        "wire_bytes": stats["wire_bytes"],
+        "seconds": seconds,
+        "messages_per_second": stats["published"] / seconds if seconds else None,
+        "alloc_peak_bytes": peak - before,
+        "alloc_net_bytes": after - before,
+    }
+
+
+def compare(results: list[dict], baseline: list[dict], tolerance: float) -> list[str]:
+    """Returns a description of every regression of ``results`` from ``baseline``."""
+    previous = {(r["benchmark"], r["entities"]): r for r in baseline}
+    regressions = []
+    for result in results:
+        old = previous.get((result["benchmark"], result["entities"]))
+        if old is None:
+            continue
+        name = f"{result['benchmark']}[{result['entities']}]"
+        for key in ("messages", "wire_bytes"):
+            if result[key] > old[key]:
+                regressions.append(f"{name} {key}: {old[key]} -> {result[key]}")
+        slower = result["seconds"] - old["seconds"]
+        if slower > TIMING_FLOOR and slower > old["seconds"] * tolerance:
+            regressions.append(
+                f"{name} seconds: {old['seconds']:.6f} -> {result['seconds']:.6f}"
+            )
+    return regressions
+
+
+def run(sizes=SIZES, benchmarks=None) -> dict:
+    """Run ``benchmarks``, defaulting to all, at each entity count in ``sizes``."""
+    return {
+        "minihass": minihass.__version__,
+        "python": platform.python_implementation(),
+        "python_version": platform.python_version(),
+        "results": [
+            measure(benchmark, entities)
+            for benchmark in benchmarks or BENCHMARKS
+            for entities in sizes
+        ],
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(SIZES))
+    parser.add_argument("--benchmarks", nargs="+", choices=list(BENCHMARKS))
+    parser.add_argument("--output", help="write results to a file, not stdout")
+    parser.add_argument("--baseline", help="results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args(argv)
+    os.environ.setdefault("LOGLEVEL", "CRITICAL")  # Failures are expected
+
+    report = run(args.sizes, args.benchmarks)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(
+                report["results"], json.load(f)["results"], args.tolerance
+            )
+        for regression in regressions:
+            print(f"Regression: {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
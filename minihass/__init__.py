@@ -6,5 +6,18 @@ __version__ = "0.1.0"
 from .binary_sensor import BinarySensor
 from .device import Device
 from .entity import Entity, SensorEntity
+from .outbox import FileOutbox, Outbox
+from .stats import Stats
+from .transport import Transport, TransportError
 
-__all__ = ["Device", "Entity", "SensorEntity", "BinarySensor"]
+__all__ = [
+    "Device",
+    "Entity",
+    "SensorEntity",
+    "BinarySensor",
+    "Outbox",
+    "FileOutbox",
+    "Stats",
+    "Transport",
+    "TransportError",
+]
@@ -0,0 +1,62 @@
+"""Logging facade that checks the log level before formatting messages"""
+
+from os import getenv
+
+import adafruit_logging as logging
+
+from .const import DEBUG_LOGGING
+
+_loggers = {}
+
+
+class Logger:
+    """Wraps an :class:`adafruit_logging.Logger`. Messages take ``%``-style
+    arguments, which are only formatted if the message will be logged, so that
+    logging calls below the current level allocate no strings.
+
+    Args:
+        logger (adafruit_logging.Logger) : Logger to wrap.
+    """
+
+    def __init__(self, logger: logging.Logger):
+        self.logger = logger
+
+    def isEnabledFor(self, level: int) -> bool:
+        """Returns :class:`True` if messages of ``level`` will be logged."""
+        if level <= logging.DEBUG and not DEBUG_LOGGING:
+            return False
+        return level >= self.logger.getEffectiveLevel()
+
+    def setLevel(self, level: int):
+        self.logger.setLevel(level)
+
+    def getEffectiveLevel(self) -> int:
+        return self.logger.getEffectiveLevel()
+
+    def debug(self, msg: str, *args):
+        if DEBUG_LOGGING and logging.DEBUG >= self.logger.getEffectiveLevel():
+            self.logger.debug(msg % args if args else msg)
+
+    def info(self, msg: str, *args):
+        if logging.INFO >= self.logger.getEffectiveLevel():
+            self.logger.info(msg % args if args else msg)
+
+    def warning(self, msg: str, *args):
+        if logging.WARNING >= self.logger.getEffectiveLevel():
+            self.logger.warning(msg % args if args else msg)
+
+    def error(self, msg: str, *args):
+        if logging.ERROR >= self.logger.getEffectiveLevel():
+            self.logger.error(msg % args if args else msg)
+
+
+def getLogger(name: str) -> Logger:
+    """Returns the :class:`Logger` named ``name``. The level of a new logger is set
+    once, from the ``LOGLEVEL`` environment variable, defaulting to ``WARNING``."""
+    try:
+        return _loggers[name]
+    except KeyError:
+        logger = logging.getLogger(name)
+        logger.setLevel(getattr(logging, getenv("LOGLEVEL", ""), logging.WARNING))  # type: ignore
+        _loggers[name] = Logger(logger)
+        return _loggers[name]
@@ -201,3 +201,73 @@ def validate_queue_option(param, strict: bool = False) -> str:
         raise ValueError(
             f'Invalid parameter, {param}. Should be "yes", "no", or "always"'
         )
+
+
+def validate_discovery_mode(param, strict: bool = False) -> str:
+    """Validates that the entry is a valid discovery mode, either `"entity"` or
+    `"device"`. If ``strict`` is :class:`False`, the parameter is converted to
+    lowercase before validation.
+
+    Args:
+        param (str): Parameter to validate
+        strict (bool, optional): Disallow values that are not lowercase.
+            Defaults to False.
+
+    Raises:
+        ValueError : On an invalid discovery mode
+
+    Returns:
+        str: `"entity"` or `"device"`
+    """
+
+    if not strict:
+        try:
+            param = param.lower()
+        except AttributeError:
+            pass
+
+    if param in ["entity", "device"]:
+        return param
+
+    raise ValueError(f'Invalid parameter, {param}. Should be "entity" or "device"')
+
+
+def validate_history_policy(param) -> str:
+    """Validates that the entry is a valid history buffer policy, either
+    `"drop_oldest"` or `"drop_newest"`.
+
+    Args:
+        param (str): Parameter to validate
+
+    Raises:
+        ValueError : On an invalid policy
+
+    Returns:
+        str: `"drop_oldest"` or `"drop_newest"`
+    """
+
+    if param in ["drop_oldest", "drop_newest"]:
+        return param
+
+    raise ValueError(
+        f'Invalid parameter, {param}. Should be "drop_oldest" or "drop_newest"'
+    )
+
+
+def validate_qos(param) -> int:
+    """Validates that the entry is a valid MQTT QoS level, either `0` or `1`.
+
+    Args:
+        param (int): Parameter to validate
+
+    Raises:
+        ValueError : On an invalid QoS level
+
+    Returns:
+        int: `0` or `1`
+    """
+
+    if param in [0, 1] and not isinstance(param, bool):
+        return param
+
+    raise ValueError(f"Invalid parameter, {param}. Should be 0 or 1")
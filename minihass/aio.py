@@ -0,0 +1,249 @@
+"""Implements an asyncio front end for :class:`Device`"""
+
+import asyncio
+from json import loads
+from time import monotonic
+
+from .const import *
+from .device import Device
+from .entity import SensorEntity
+from .outbox import Outbox
+
+
+def _priority(topic: str) -> int:
+    """Returns the outbox priority of a message published on ``topic``."""
+    if topic.endswith("/availability"):
+        return PRIORITY_AVAILABILITY
+    if topic.endswith("/config"):
+        return PRIORITY_DISCOVERY
+    return PRIORITY_STATE
+
+
+class _QueueingClient:
+    """Stands in for the MQTT client of the :class:`Device` wrapped by an
+    :class:`AsyncDevice`. Published messages are recorded in an :class:`Outbox` for
+    the flush task to send, so the synchronous code paths of :class:`Device` and
+    :class:`Entity` never wait on the network. Everything else is forwarded to the
+    real client."""
+
+    def __init__(self, mqtt_client, sent: Outbox):
+        object.__setattr__(self, "_client", mqtt_client)
+        object.__setattr__(self, "_sent", sent)
+
+    def publish(self, topic: str, msg, retain: bool = False, qos: int = 0):
+        priority = _priority(topic)
+        if priority == PRIORITY_STATE and msg[:1] in ("{", b"{"):
+            # States of several entities share a topic, so a pending state document
+            # is merged with the new one rather than replaced
+            values = loads(msg)
+            if isinstance(values, dict):
+                self._sent.merge(topic, values, retain, qos, priority)
+                return
+        self._sent.put(topic, msg, retain, qos, priority)
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._client, name, value)
+
+
+class _QueuedDevice(Device):
+    """The :class:`Device` wrapped by an :class:`AsyncDevice`. Its stand-in client
+    only queues messages, so discovery messages are recorded as announced by
+    :meth:`AsyncDevice.flush()` once they are actually sent."""
+
+    __slots__ = ()
+
+    def _record_announced(self, topic: str, payload: str):
+        pass  # Queued, not yet published
+
+    def _record_sent(self, topic: str, payload: str):
+        super()._record_announced(topic, payload)
+
+
+class AsyncDevice:
+    """An asyncio front end for a :class:`Device`, for use with MQTT clients whose
+    ``publish()`` method is a coroutine, as well as blocking clients.
+
+    The wrapped :class:`Device` is created with ``defer_states`` set, and with a
+    stand-in MQTT client that records messages rather than sending them. Setting
+    entity states, availability or adding entities therefore never blocks, and
+    sampling coroutines can run while messages are sent by :meth:`flush()` or by the
+    background task started with :meth:`start()`.
+
+    Messages waiting to be sent are held one per topic, like the device's
+    :attr:`Device.outbox`: if a topic is published again before it is sent, only the
+    latest message is sent. State documents on the device state topic are merged, so
+    the latest state of every entity is sent.
+
+    Attributes and methods that are not listed here, such as
+    :attr:`Device.entities` or :meth:`Device.add_entity()`, are those of the wrapped
+    :class:`Device`.
+
+    Args:
+        mqtt_client : MQTT client with a :class:`adafruit_minimqtt.adafruit_minimqtt.MQTT`
+            compatible interface. ``publish()`` may return an awaitable.
+        flush_interval (float, optional) : Number of seconds the background task
+            waits between flushes. Defaults to ``1``.
+        *args : Passed to :class:`Device`.
+        **kwargs : Passed to :class:`Device`. ``defer_states`` is always set.
+
+    Attributes:
+        device (Device) : The wrapped device.
+        mqtt_client : The real MQTT client.
+        flush_interval (float) : Background flush interval in seconds.
+    """
+
+    def __init__(self, mqtt_client, *args, flush_interval: float = 1, **kwargs):
+        kwargs["defer_states"] = True
+        self.mqtt_client = mqtt_client
+        self.flush_interval = flush_interval
+        self._sent = Outbox()
+        self._task = None
+        self.device = _QueuedDevice(
+            _QueueingClient(mqtt_client, self._sent), *args, **kwargs
+        )
+
+    def __getattr__(self, name):
+        return getattr(self.device, name)
+
+    @property
+    def availability(self) -> bool:
+        """Availability of the device, see :attr:`Device.availability`. Setting this
+        property queues an availability message for the next flush."""
+        return self.device.availability
+
+    @availability.setter
+    def availability(self, value: bool):
+        self.device.availability = value
+
+    async def _publish(self, topic: str, payload, retain: bool, qos: int):
+        result = self.mqtt_client.publish(topic, payload, retain, qos)
+        if hasattr(result, "send") or hasattr(result, "__await__"):
+            await result
+
+    async def flush(self, budget: float = 0) -> int:
+        """Send the messages waiting in the device's :attr:`Device.outbox` and those
+        recorded by the stand-in client, in priority order. Sending stops at the
+        first failure, leaving the remaining messages for the next flush. Any
+        exception raised by the MQTT client is treated as a failure, so that the
+        background task keeps running.
+
+        The number of messages and bytes sent are limited by the device's
+        :attr:`Device.flush_max_messages` and :attr:`Device.flush_max_bytes`.
+
+        Args:
+            budget (float, optional) : Maximum time in seconds to spend sending.
+                Messages that don't fit in the budget remain queued. If ``0``, all
+                queued messages are sent. Defaults to ``0``.
+
+        Returns:
+            int : Number of messages sent.
+        """
+        device = self.device
+        device.flush()  # Only moves messages to the stand-in client's outbox
+        if not device.outbox:
+            device.flush_history()
+
+        max_messages = device.flush_max_messages
+        max_bytes = device.flush_max_bytes
+        start = monotonic()
+        count = 0
+        sent = 0
+        for topic in self._sent.topics:
+            if budget and monotonic() - start >= budget:
+                device.logger.debug("Flush budget exhausted")
+                break
+            if max_messages and count >= max_messages:
+                break
+
+            payload, retain, qos = self._sent.message(topic)
+            size = len(topic) + len(payload)
+            if max_bytes and count and sent + size > max_bytes:
+                break
+
+            try:
+                await self._publish(topic, payload, retain, qos)
+            except Exception as e:  # Asyncio clients raise their own exceptions
+                device.logger.warning("Unable to flush state queue, %s", e.args)
+                break
+            self._sent.discard(topic)
+            if _priority(topic) == PRIORITY_DISCOVERY:
+                device._record_sent(topic, payload)
+            count += 1
+            sent += size
+
+        if count:
+            device._save_announced()
+        return count
+
+    async def announce(self, clean: bool = False, force: bool = False) -> bool:
+        """Announce the device's entities, see :meth:`Device.announce()`, and send
+        the discovery messages.
+
+        Returns:
+            bool : :class:`True` if all messages were sent.
+        """
+        self.device.announce(clean=clean, force=force)
+        await self.flush()
+        return not self._sent
+
+    async def publish_state(self, entity: SensorEntity | None = None) -> bool:
+        """Send the state of ``entity``, or the queued states of every entity.
+
+        Args:
+            entity (SensorEntity, optional) : Entity whose current state is
+                published. Defaults to :class:`None`, sending only queued states.
+
+        Returns:
+            bool : :class:`True` if all messages were sent.
+        """
+        if entity is not None:
+            device = self.device
+            device.outbox.merge(
+                device.state_topic,
+                {entity.state_key: entity.state},
+                device.state_retain,
+                device.state_qos,
+            )
+        await self.flush()
+        return not self._sent
+
+    async def publish_availability(self) -> bool:
+        """Send the availability of the device, see
+        :meth:`Device.publish_availability()`.
+
+        Returns:
+            bool : :class:`True` if all messages were sent.
+        """
+        self.device.publish_availability()
+        await self.flush()
+        return not self._sent
+
+    async def run(self):
+        """Flush every :attr:`flush_interval` seconds until cancelled."""
+        while True:
+            await self.flush()
+            await asyncio.sleep(self.flush_interval)
+
+    def start(self):
+        """Start :meth:`run()` as a background task, if not already running.
+
+        Returns:
+            asyncio.Task : The background flush task.
+        """
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+        return self._task
+
+    async def stop(self):
+        """Cancel the background flush task, then send any remaining messages."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
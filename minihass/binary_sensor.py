@@ -23,6 +23,10 @@ class BinarySensor(SensorEntity):
     """
 
     COMPONENT = "binary_sensor"
+    COMPONENT_CONFIG = {"force_update": False, "pl_off": False, "pl_on": True}
+    HISTORY_TYPECODE = "b"
+
+    __slots__ = ("expire_after", "force_update")
 
     def __init__(
         self, *args, force_update: bool = False, expire_after: int = 0, **kwargs
@@ -30,18 +34,18 @@ class BinarySensor(SensorEntity):
         self.expire_after = expire_after
         self.force_update = validators.validate_bool(force_update)
 
-        self.component_config = {
-            "force_update": self.force_update,
-            "pl_off": False,
-            "pl_on": True,
-        }
+        super().__init__(*args, **kwargs)
 
+        # Defaults are shared through COMPONENT_CONFIG, so sensors that don't
+        # override them need no configuration dictionary of their own
+        if self.force_update:
+            self.component_config["force_update"] = True
         if self.expire_after:
-            self.component_config.update({"expire_after": "foo"})  # type: ignore
+            self.component_config["expire_after"] = self.expire_after
 
-        super().__init__(*args, **kwargs)
+    def validate_state(self, state) -> bool:
+        return validators.validate_bool(state)
 
     @SensorEntity.state.setter
     def state(self, state):
-        state = validators.validate_bool(state)
-        self._state_setter(state)  # type: ignore
+        self._state_setter(self.validate_state(state))  # type: ignore
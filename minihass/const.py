@@ -1,3 +1,13 @@
 from micropython import const  # type: ignore
 
 HA_MQTT_PREFIX = "homeassistant"
+HA_STATUS_TOPIC = f"{HA_MQTT_PREFIX}/status"
+
+# Outbox priorities, lowest value is published first
+PRIORITY_AVAILABILITY = const(0)
+PRIORITY_STATE = const(1)
+PRIORITY_DISCOVERY = const(2)
+
+# Set to False to make all debug logging calls return immediately, e.g. for
+# production builds
+DEBUG_LOGGING = const(True)
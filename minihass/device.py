@@ -1,11 +1,19 @@
-from os import getenv
+from __future__ import annotations
+
+from binascii import crc32
+from json import dumps, loads
+from time import monotonic
 
-import adafruit_logging as logging
 from adafruit_minimqtt.adafruit_minimqtt import CONNACK_ERRORS, MQTT, MMQTTException
 
+from . import __version__
 from . import _validators as validators
+from ._logging import getLogger
 from .const import *
 from .entity import Entity, SensorEntity
+from .outbox import Outbox
+from .ratelimit import TokenBucket
+from .stats import Stats
 
 
 class Device:
@@ -27,8 +35,9 @@ class Device:
     .. _Last Will and Testament: https://www.hivemq.com/blog/mqtt-essentials-part-9-last-will-and-testament/
 
     Args:
-        mqtt_client (adafruit_minimqtt.adafruit_minimqtt.MQTT) : MMQTT
-            object for communicating with Home Assistant.
+        mqtt_client (adafruit_minimqtt.adafruit_minimqtt.MQTT|Transport) : MMQTT
+            object for communicating with Home Assistant, or a :class:`Transport`
+            adapter for another MQTT client.
         device_id (str, optional) : Gloablly unique identifier for the Home
             Assistant device. Auto-generated if not specified.
         name (str, optional) : Device name. Auto-generated if not specified.
@@ -41,18 +50,146 @@ class Device:
             Defaults to :class:`None`.
         entities (list[Entity], optional) : List of entity objects to include as
             part of the device. Defaults to :class:`None`
+        batch_states (bool, optional) : When :class:`True`, entity state changes are
+            collected by the device and published together as a single merged JSON
+            document by :meth:`flush_states()`, rather than one message per change.
+            Defaults to :class:`False`.
+        batch_interval (float, optional) : Minimum number of seconds between
+            automatic flushes of batched states. If ``0``, batched states are only
+            published when :meth:`flush_states()` is called. Defaults to ``0``.
+        discovery ("entity"|"device", optional) : MQTT discovery mode. If
+            ``"entity"``, each entity publishes its own discovery message. If
+            ``"device"``, a single `device discovery`_ message carrying the
+            configuration of every entity is published by :meth:`announce()`.
+            Defaults to ``"entity"``.
+
+        skip_unchanged (bool, optional) : When :class:`True`, :meth:`announce()` only
+            republishes discovery messages whose content has changed since they
+            were last published. Defaults to :class:`False`.
+        announce_cache_file (str, optional) : Path of a file used to persist the
+            hashes of published discovery messages across restarts, used with
+            ``skip_unchanged``. Defaults to ``""`` (not persisted).
+        announce_on_birth (bool, optional) : When :class:`True`, the device
+            subscribes to Home Assistant's status topic and re-announces its entities
+            when Home Assistant comes ``online``, instead of on every connection to
+            the broker. Entities are still announced on the first connection.
+            Defaults to :class:`False`.
+        defer_states (bool, optional) : When :class:`True`, assigning an entity's
+            state only queues it, regardless of the entity's ``queue`` setting.
+            Queued states are published by :meth:`loop()` or :meth:`flush()`, so
+            that sampling code never waits on the network. Defaults to
+            :class:`False`.
+        flush_max_messages (int, optional) : Maximum number of messages published by
+            each call to :meth:`loop()`, and when (re)connecting to the broker. If
+            ``0``, the number of messages is not limited. Defaults to ``0``.
+        flush_max_bytes (int, optional) : Maximum number of topic and payload bytes
+            published by each call to :meth:`loop()`, and when (re)connecting to the
+            broker. At least one message is always published. If ``0``, the number of
+            bytes is not limited. Defaults to ``0``.
+        rate_limit (float, optional) : Maximum sustained number of state messages
+            per second for the device as a whole. Also limits every message
+            published by :meth:`flush()`. States over the limit are queued, never dropped. If
+            ``0``, the rate is not limited. Defaults to ``0``.
+        rate_burst (int, optional) : Number of state messages that can be sent in a
+            burst before ``rate_limit`` applies. Defaults to ``1``.
+        outbox (Outbox, optional) : Store for messages waiting to be published. Pass
+            a :class:`FileOutbox` to keep queued states across reboots; they are
+            published by the first :meth:`publish_state_queue()` or :meth:`flush()`.
+            Defaults to a new in-memory :class:`Outbox`.
+        short_keys (bool, optional) : When :class:`True`, each entity is assigned a
+            short base-36 key, in the order the entities are added, which replaces
+            its ``object_id`` as the key of its state in JSON state payloads. The
+            value templates sent with discovery messages use the same keys.
+            Defaults to :class:`False`.
+        state_qos (int, optional) : Default MQTT QoS level of entity state messages,
+            ``0`` or ``1``. A merged state document published on
+            :attr:`state_topic` uses the highest QoS level of the merged states.
+            Discovery and availability messages are always published with QoS 1.
+            Defaults to ``1``.
+        state_retain (bool, optional) : Default MQTT retain flag of entity state
+            messages. A merged state document published on :attr:`state_topic` is
+            retained if any of the merged states is. Discovery and availability
+            messages are always retained. Defaults to :class:`True`.
+        stats (bool, optional) : When :class:`True`, publishing and allocation
+            statistics are collected in a :class:`Stats` object. The MQTT client is
+            wrapped to count messages, so :attr:`mqtt_client` is the wrapper.
+            Defaults to :class:`False`.
+
+    .. _device discovery: https://www.home-assistant.io/integrations/mqtt/#device-discovery-payload
+
+    .. caution:: ``skip_unchanged`` relies on the broker retaining discovery
+        messages. If the broker loses its retained messages, call
+        :meth:`announce()` with ``force=True``.
 
     Attributes:
         device_id (str) : Effective Device ID. Either normalized from the
             ``device_id`` parameter, or derived from ``name``
-        mqtt_client (adafruit_minimqtt.adafruit_minimqtt.MQTT) : MQTT client.
+        mqtt_client (adafruit_minimqtt.adafruit_minimqtt.MQTT|Transport) : MQTT
+            client.
         connections (list[tuple(str, str)]) : List of Home Aassistant device
             connections.
+        batch_states (bool) : State batching mode.
+        batch_interval (float) : Automatic batch flush interval in seconds.
+        discovery (str) : MQTT discovery mode.
+        discovery_topic (str) : Topic used for device discovery messages.
+        skip_unchanged (bool) : Skip announcing unchanged discovery messages.
+        announce_cache_file (str) : Discovery hash persistence file.
+        announce_on_birth (bool) : Announce on Home Assistant birth messages.
+        outbox (Outbox) : Messages waiting to be published by :meth:`flush()`.
+        flush_max_messages (int) : Message budget of :meth:`loop()`.
+        flush_max_bytes (int) : Byte budget of :meth:`loop()`.
+        rate_limiter (TokenBucket) : Device rate limiter, or :class:`None`. Its
+            ``throttled`` attribute counts messages deferred by the limit.
+        defer_states (bool) : Queue all state changes for :meth:`loop()`.
+        short_keys (bool) : Use short keys in JSON state payloads.
+        state_qos (int) : Default QoS level of state messages.
+        state_retain (bool) : Default retain flag of state messages.
+        stats (Stats) : Publishing and allocation statistics, or :class:`None`.
     """
 
+    __slots__ = (
+        "logger",
+        "name",
+        "device_id",
+        "manufacturer",
+        "hw_version",
+        "mqtt_client",
+        "connections",
+        "device_config",
+        "_availability",
+        "availability_topic",
+        "state_topic",
+        "discovery",
+        "discovery_topic",
+        "defer_states",
+        "batch_states",
+        "batch_interval",
+        "state_qos",
+        "state_retain",
+        "outbox",
+        "flush_max_messages",
+        "flush_max_bytes",
+        "rate_limiter",
+        "_state_document",
+        "_last_flush",
+        "announce_on_birth",
+        "_session_announced",
+        "_entities",
+        "_components",
+        "_history_pending",
+        "_discovery_cache",
+        "short_keys",
+        "_state_keys",
+        "skip_unchanged",
+        "announce_cache_file",
+        "_announced",
+        "_announced_changed",
+        "stats",
+    )
+
     def __init__(
         self,
-        mqtt_client: MQTT,
+        mqtt_client: MQTT | Transport,  # type: ignore
         device_id: str = "",
         name: str = "",
         manufacturer: str = "",
@@ -60,9 +197,24 @@ class Device:
         connections: list[tuple[str, str]] = [],
         entities: list[Entity] = [],
         logger_name: str = "minimqtt",
+        batch_states: bool = False,
+        batch_interval: float = 0,
+        discovery: str = "entity",
+        skip_unchanged: bool = False,
+        announce_cache_file: str = "",
+        announce_on_birth: bool = False,
+        defer_states: bool = False,
+        flush_max_messages: int = 0,
+        flush_max_bytes: int = 0,
+        rate_limit: float = 0,
+        rate_burst: int = 1,
+        outbox: Outbox | None = None,
+        short_keys: bool = False,
+        state_qos: int = 1,
+        state_retain: bool = True,
+        stats: bool = False,
     ):
-        self.logger = logging.getLogger(logger_name)
-        self.logger.setLevel(getattr(logging, getenv("LOGLEVEL", ""), logging.WARNING))  # type: ignore
+        self.logger = getLogger(logger_name)
         self.name = validators.validate_string(name) if name else "MQTT Device"
 
         if device_id:
@@ -73,6 +225,7 @@ class Device:
         self.manufacturer = validators.validate_string(manufacturer, null_ok=True)
         self.hw_version = validators.validate_string(hw_version, null_ok=True)
         self.mqtt_client = mqtt_client
+        self.stats = None
         self.connections = connections if connections else []
 
         self.device_config = {
@@ -93,14 +246,59 @@ class Device:
             f"{HA_MQTT_PREFIX}/device/{self.device_id}/availability"
         )
         self.state_topic = f"{HA_MQTT_PREFIX}/device/{self.device_id}/state"
+        self.discovery = validators.validate_discovery_mode(discovery)
+        self.discovery_topic = f"{HA_MQTT_PREFIX}/device/{self.device_id}/config"
+
+        self.defer_states = validators.validate_bool(defer_states)
+        self.batch_states = validators.validate_bool(batch_states)
+        self.batch_interval = batch_interval
+        self.state_qos = validators.validate_qos(state_qos)
+        self.state_retain = validators.validate_bool(state_retain)
+        self.outbox = outbox if outbox is not None else Outbox()
+        if stats:
+            self.stats = Stats(self.outbox)
+            self.mqtt_client = self.stats.wrap(mqtt_client)
+        self.flush_max_messages = flush_max_messages
+        self.flush_max_bytes = flush_max_bytes
+        self.rate_limiter = TokenBucket(rate_limit, rate_burst) if rate_limit else None
+        self._state_document = {}
+        self._last_flush = monotonic()
 
         self.mqtt_client.will_set(self.state_topic, "offline", 1, True)
         self.mqtt_client.on_connect = self.mqtt_on_connect_cb  # type: ignore
 
-        self._entities = []
+        self.announce_on_birth = validators.validate_bool(announce_on_birth)
+        self._session_announced = False
+        if self.announce_on_birth:
+            self.mqtt_client.add_topic_callback(HA_STATUS_TOPIC, self.ha_status_cb)
+
+        self._entities = {}
+        self._components = {}
+        self._history_pending = {}
+        self._discovery_cache = None
 
+        self.short_keys = validators.validate_bool(short_keys)
+        self._state_keys = {}
+
+        self.skip_unchanged = validators.validate_bool(skip_unchanged)
+        self.announce_cache_file = validators.validate_string(
+            announce_cache_file, null_ok=True
+        )
+        self._announced = {}
+        self._announced_changed = False
+        self._load_announced()
+
+        # Register every entity before announcing, so that a device discovery
+        # payload is serialized and published once rather than once per entity
         for entity in entities:
-            self.add_entity(entity)
+            self._register_entity(entity)
+        if self.discovery == "device":
+            if self._entities:
+                self.announce()
+        else:
+            for entity in self:
+                self._announce_entity(entity)
+            self._save_announced()
 
     @property
     def entities(self) -> list[Entity]:
@@ -112,7 +310,44 @@ class Device:
         Returns:
             list[Entity]: List of Entity subclasses.
         """
-        return list(self._entities)
+        return list(self._entities.values())
+
+    def __len__(self) -> int:
+        return len(self._entities)
+
+    def __bool__(self) -> bool:
+        """A device is always truthy, even without entities."""
+        return True
+
+    def __iter__(self):
+        """Iterate over the device's entities, in the order they were added,
+        without copying them. The device must not be modified while iterating."""
+        return iter(self._entities.values())
+
+    def __contains__(self, entity) -> bool:
+        """Returns :class:`True` if ``entity``, an :class:`Entity` or an
+        ``object_id``, is a member of the device."""
+        if isinstance(entity, Entity):
+            return self._entities.get(entity.object_id) is entity
+        return entity in self._entities
+
+    def __getitem__(self, object_id: str) -> Entity:
+        """Look up an entity by ``object_id``, e.g. ``device["temperature"]``. The
+        chip ID suffix added to generated object IDs may be omitted.
+
+        Raises:
+            KeyError : No entity with that ``object_id`` is a member of the device.
+        """
+        try:
+            return self._entities[object_id]
+        except KeyError:
+            pass
+        return self._entities[f"{object_id}{Entity.chip_id()}"]
+
+    def by_component(self, component: str) -> list[Entity]:
+        """Returns a list of the device's entities of a component type, e.g.
+        ``"binary_sensor"``."""
+        return list(self._components.get(component, {}).values())
 
     @property
     def availability(self) -> bool:
@@ -126,13 +361,20 @@ class Device:
         self._availability = validators.validate_bool(value)
 
         self.logger.warning(
-            f"{self.device_id} {'available' if self._availability else 'unavailable'}"
+            "%s %s",
+            self.device_id,
+            "available" if self._availability else "unavailable",
         )
 
         try:
             self.publish_availability()
         except MMQTTException as e:
-            self.logger.error(f"Availability publishing failed, {e.args}")
+            self.logger.error("Availability publishing failed, %s", e.args)
+            self.outbox.put(
+                self.availability_topic,
+                "online" if self.availability else "offline",
+                priority=PRIORITY_AVAILABILITY,
+            )
 
     def add_entity(self, entity: Entity) -> bool:
         """Add an entity to the device
@@ -140,57 +382,335 @@ class Device:
         Args:
             Entity (Entity): Entity to add.
 
+        Raises:
+            TypeError : ``entity`` is not an :class:`Entity`.
+            ValueError : Another entity with the same ``object_id`` is already a
+                member of the device.
+
         Returns:
             bool: :class:`True` if the entity was added. :class:`False` if the entity
                 is already a member of the device.
         """
 
-        if isinstance(entity, Entity):
-            if not entity in self._entities:
-                self._entities.append(entity)
-                entity.device = self
-                entity.announce()
-                return True
-            else:
-                return False
+        if not self._register_entity(entity):
+            return False
+
+        if self.discovery == "device":
+            self.announce()
         else:
+            self._announce_entity(entity)
+            self._save_announced()
+        return True
+
+    def _register_entity(self, entity: Entity) -> bool:
+        """Make ``entity`` a member of the device without announcing it. Raises
+        and returns as :meth:`add_entity()`."""
+        if not isinstance(entity, Entity):
             raise TypeError(f"Expected Entity, got {type(entity).__name__}")
 
-    def delete_entity(self, entity: Entity) -> bool:
+        existing = self._entities.get(entity.object_id)
+        if existing is entity:
+            return False
+        if existing is not None:
+            raise ValueError(f"Duplicate entity object_id {entity.object_id}")
+
+        self._entities[entity.object_id] = entity
+        self._components.setdefault(entity.COMPONENT, {})[entity.object_id] = entity
+        if self.short_keys:
+            entity._state_key = self._short_key(entity)
+        entity.device = self  # Invalidates device discovery cache
+        return True
+
+    def delete_entity(self, entity: Entity | str) -> bool:
         """Delete an entity from the device
 
         Args:
-            entity (Entity): Entity to delete.
+            entity (Entity | str): Entity to delete, or its ``object_id``. The chip
+                ID suffix of a generated ``object_id`` may be omitted.
 
         Returns:
             bool: :class:`True` if the entity is deleted, :class:`False` if the entity
                 was not a member of the device
         """
-        if entity in self._entities:
-            entity.withdraw()
-            self._entities.remove(entity)
+        if isinstance(entity, str):
+            try:
+                entity = self[entity]
+            except KeyError:
+                return False
+
+        if isinstance(entity, Entity) and entity in self:
+            del self._entities[entity.object_id]
+            del self._components[entity.COMPONENT][entity.object_id]
+            self._history_pending.pop(entity.object_id, None)
+            # Stop publishing the entity's state with the rest of the device
+            self._state_document.pop(entity.state_key, None)
+            self.outbox.discard(self.state_topic, entity.state_key)
+            self.invalidate_discovery()
+            if self.discovery == "device":
+                self._announce_device(removed=[entity])
+            else:
+                if self._announced.pop(entity.discovery_topic, None) is not None:
+                    self._announced_changed = True
+                    self._save_announced()
+                entity.withdraw()
+            entity._state_key = None
             entity.device = None
             return True
         else:
             return False
 
-    def announce(self, clean: bool = False) -> bool:
+    def _short_key(self, entity: Entity) -> str:
+        """Returns the short state key for ``entity``, assigning the next unused
+        base-36 key if it doesn't have one yet."""
+        try:
+            return self._state_keys[entity.object_id]
+        except KeyError:
+            pass
+
+        n = len(self._state_keys)
+        key = ""
+        while True:
+            n, digit = divmod(n, 36)
+            key = "0123456789abcdefghijklmnopqrstuvwxyz"[digit] + key
+            if not n:
+                break
+
+        self._state_keys[entity.object_id] = key
+        return key
+
+    def announce(
+        self, clean: bool = False, force: bool = False, queue: bool = False
+    ) -> bool:
         """Send MQTT discovery messages for all device entities.
 
         Used immediately after connnecting to the MQTT broker to configure the
         corresponding entities in Home Assistant. Individual entities can be announced
-        with their own :meth:`Entity.announce()` methods.
+        with their own :meth:`Entity.announce()` methods. If :attr:`discovery` is
+        ``"device"``, a single device discovery message is published instead.
 
         Args:
             clean (bool, optional) : Remove previously discovered entites that are no
                 longer present. Defaults to :class:`False`.
+            force (bool, optional) : Publish all discovery messages, even if
+                :attr:`skip_unchanged` is set and they have not changed. Defaults to
+                :class:`False`.
+            queue (bool, optional) : Queue the discovery messages in the
+                :attr:`outbox` instead of publishing them immediately. Queued
+                discovery messages are published after availability and states.
+                Defaults to :class:`False`.
 
         Returns:
             bool : :class:`True` if successful.
         """
+        stats = self.stats
+        if stats:
+            stats.announces += 1
+            start = stats.start()
+
+        if queue:
+            self._queue_announce(force=force)
+            ret = True
+        elif self.discovery == "device":
+            ret = self._announce_device(force=force)
+        else:
+            ret = True
+            for entity in self:
+                if self._announce_entity(entity, force=force) is False:
+                    ret = False
+
+        self._save_announced()
+        if stats:
+            stats.record("announce", start)
+        return ret
+
+    def _queue_announce(self, force: bool = False):
+        """Queue discovery messages that need publishing in the outbox."""
+        if self.discovery == "device":
+            if self._discovery_cache is None:
+                self._discovery_cache = dumps(self.discovery_payload())
+            messages = [(self.discovery_topic, self._discovery_cache)]
+        else:
+            messages = [entity.discovery_message() for entity in self]
+
+        for topic, payload in messages:
+            if force or not self._is_announced(topic, payload):
+                self.outbox.put(topic, payload, True, 1, PRIORITY_DISCOVERY)
+
+    def _announce_entity(self, entity: Entity, force: bool = False) -> bool | None:
+        """Announce a single entity, unless its discovery message is unchanged.
+
+        Returns:
+            bool | None : Result of :meth:`Entity.announce()`, or :class:`None` if the
+                announcement was skipped.
+        """
+        topic, payload = entity.discovery_message()
+        if not force and self._is_announced(topic, payload):
+            self.logger.debug("Discovery for %s unchanged, skipping", entity.object_id)
+            return None
+
+        ret = entity.announce()
+        if ret:
+            self._record_announced(topic, payload)
+            if self.stats:
+                self.stats.discovery_published(topic)
+        return ret
+
+    def _is_announced(self, topic: str, payload: str) -> bool:
+        """Returns :class:`True` if ``payload`` matches the last discovery message
+        published to ``topic`` and :attr:`skip_unchanged` is set."""
+        return self.skip_unchanged and self._announced.get(topic) == crc32(
+            payload.encode()
+        )
+
+    def _record_announced(self, topic: str, payload: str):
+        """Remember the hash of a published discovery message."""
+        if self.skip_unchanged:
+            self._announced[topic] = crc32(payload.encode())
+            self._announced_changed = True
+
+    def _load_announced(self):
+        """Load discovery message hashes from :attr:`announce_cache_file`."""
+        if not (self.skip_unchanged and self.announce_cache_file):
+            return
+
+        try:
+            with open(self.announce_cache_file, "r") as f:
+                self._announced = loads(f.read())
+        except (OSError, ValueError) as e:
+            self.logger.info("Discovery cache not loaded, %s", e.args)
+
+    def _save_announced(self):
+        """Persist discovery message hashes to :attr:`announce_cache_file`."""
+        if not (self._announced_changed and self.announce_cache_file):
+            return
+
+        try:
+            with open(self.announce_cache_file, "w") as f:
+                f.write(dumps(self._announced))
+            self._announced_changed = False
+        except OSError as e:
+            self.logger.warning("Unable to save discovery cache, %s", e.args)
+
+    def discovery_payload(self, removed: list[Entity] = []) -> dict:
+        """Build the device discovery payload for all device entities.
+
+        The ``dev`` block is included once for the whole device, and each entity's
+        configuration is listed under ``cmps``, keyed by its ``object_id``.
+
+        Args:
+            removed (list[Entity], optional) : Entities to mark as removed from the
+                device. Their entries carry only the platform key, which causes Home
+                Assistant to delete them. Defaults to :class:`None`.
+
+        Returns:
+            dict : Device discovery payload, using abbreviated keys.
+        """
+        components = {}
+        for entity in self:
+            component = {"p": entity.COMPONENT}
+            component.update(entity.discovery_config(include_device=False))
+            components[entity.object_id] = component
+
+        for entity in removed:
+            components[entity.object_id] = {"p": entity.COMPONENT}
+
+        return {
+            "dev": self.device_config["dev"],
+            "o": {"name": "minihass", "sw": __version__},
+            "cmps": components,
+        }
+
+    def invalidate_discovery(self):
+        """Discard the cached device discovery payload. Called automatically when
+        entities are added or removed, or when an entity's discovery configuration
+        changes."""
+        self._discovery_cache = None
+
+    def _announce_device(self, removed: list[Entity] = [], force: bool = False) -> bool:
+        """Publish a single device discovery message."""
+        if removed:
+            payload = dumps(self.discovery_payload(removed))
+        else:
+            if self._discovery_cache is None:
+                self._discovery_cache = dumps(self.discovery_payload())
+            payload = self._discovery_cache
+
+            if not force and self._is_announced(self.discovery_topic, payload):
+                self.logger.debug("Device discovery unchanged, skipping")
+                return True
+
+        self.logger.info("Publishing device discovery message for %s", self.device_id)
+        try:
+            self.mqtt_client.publish(self.discovery_topic, payload, True, 1)
+        except MMQTTException as e:
+            self.logger.error("Announcement failed, %s", e.args)
+            return False
+
+        self._record_announced(self.discovery_topic, payload)
+        if self.stats:
+            self.stats.discovery_published(self.discovery_topic)
+        return True
+
+    @property
+    def pending_states(self) -> int:
+        """Number of entity states queued in the :attr:`outbox` for
+        :attr:`state_topic`. Queued states are tracked per entity by the outbox, so
+        this doesn't visit the device's entities."""
+        document = self.outbox.get(self.state_topic)
+        return len(document) if isinstance(document, dict) else 0
+
+    def update_states(self, states: dict) -> bool:
+        """Update the states of several entities at once, publishing them as a
+        single merged JSON document on :attr:`state_topic`.
+
+        Every state is validated before any entity is updated, so either all states
+        are applied or none are. Unchanged or deadbanded states are skipped as with
+        :attr:`SensorEntity.state`, but the entities' ``queue``, ``min_interval`` and
+        ``rate_limit`` settings are not applied. States stay queued in the
+        :attr:`outbox` if :attr:`defer_states` is set, if the device's rate limit is
+        exceeded, or if publishing fails.
+
+        Args:
+            states (dict) : New states, keyed by :class:`SensorEntity` or by
+                ``object_id``.
+
+        Raises:
+            KeyError : An entity is not a member of the device.
+            TypeError : An entity does not have a state, or a state is invalid.
+            ValueError : A state is invalid.
+
+        Returns:
+            bool : :class:`True` if a merged state document was published.
+        """
+        updates = []
+        for key, state in states.items():
+            if isinstance(key, Entity):
+                if key not in self:
+                    raise KeyError(key.object_id)
+                entity = key
+            else:
+                entity = self[key]
+            if not isinstance(entity, SensorEntity):
+                raise TypeError(f"{entity.object_id} does not have a state")
+            updates.append((entity, entity.validate_state(state)))
+
+        count = 0
+        for entity, state in updates:
+            if entity._queue_update(state):
+                count += 1
+        self.logger.debug("Updated %s states", count)
+
+        if not count or self.defer_states:
+            return False
+        if self.rate_limiter and not self.rate_limiter.consume():
+            self.logger.debug("State update rate limited, queueing")
+            return False
 
-        for entity in [x for x in self._entities]:
-            entity.announce()
+        try:
+            self._publish_state_document()
+        except MMQTTException as e:
+            self.logger.warning("Unable to publish state update, %s", e.args)
+            return False
 
         return True
 
@@ -201,13 +721,199 @@ class Device:
             bool : :class:`True` if at least one sensor state was published.
         """
 
-        ret = False
-        for entity in (e for e in self.entities if isinstance(e, SensorEntity)):
-            if entity.state_queued:
-                entity.publish_state()
-                ret = True
+        return self.flush() > 0
 
-        return ret
+    def flush(
+        self, budget: float = 0, max_messages: int = 0, max_bytes: int = 0
+    ) -> int:
+        """Publish messages in the device :attr:`outbox`, one per topic, in priority
+        order: availability first, then states, then discovery messages.
+
+        Publishing stops at the first failure, leaving the remaining messages queued
+        for the next call.
+
+        Args:
+            budget (float, optional) : Maximum time in seconds to spend publishing.
+                Messages that don't fit in the budget remain queued. If ``0``, all
+                queued messages are published. Defaults to ``0``.
+            max_messages (int, optional) : Maximum number of messages to publish. If
+                ``0``, the number of messages is not limited. Defaults to ``0``.
+            max_bytes (int, optional) : Maximum number of topic and payload bytes to
+                publish. At least one message is published. If ``0``, the number of
+                bytes is not limited. Defaults to ``0``.
+
+        Returns:
+            int : Number of messages published.
+        """
+        stats = self.stats
+        if stats:
+            stats.max_queue_depth = max(stats.max_queue_depth, len(self.outbox))
+            alloc_start = stats.start()
+
+        start = monotonic()
+        count = 0
+        sent = 0
+        for topic in self.outbox.topics:
+            if budget and monotonic() - start >= budget:
+                self.logger.debug("Flush budget exhausted")
+                break
+            if max_messages and count >= max_messages:
+                break
+
+            if topic == self.state_topic:
+                document = self._state_document_pending()
+                payload = dumps(document)
+                retain, qos = self.outbox.flags(topic)
+            else:
+                payload, retain, qos = self.outbox.message(topic)
+            discovery = self.outbox.priority(topic) == PRIORITY_DISCOVERY
+
+            size = len(topic) + len(payload)
+            if max_bytes and count and sent + size > max_bytes:
+                break
+            if self.rate_limiter and not self.rate_limiter.consume():
+                self.logger.debug("Flush rate limited")
+                break
+
+            try:
+                self.mqtt_client.publish(topic, payload, retain, qos)
+            except MMQTTException as e:
+                self.logger.warning("Unable to flush state queue, %s", e.args)
+                break
+
+            self.outbox.discard(topic)
+            if topic == self.state_topic:
+                self._state_published(document)
+            elif discovery:
+                # Only remember discovery messages that were actually published
+                self._record_announced(topic, payload)
+                if stats:
+                    stats.discovery_published(topic)
+            count += 1
+            sent += size
+
+        if count:
+            self.outbox.sync()
+            self._save_announced()
+        if stats:
+            stats.record("flush", alloc_start)
+        return count
+
+    def loop(self, budget: float = 0) -> int:
+        """Publish queued states without blocking for longer than ``budget``.
+
+        Intended to be called regularly from the main loop when
+        :attr:`defer_states` is set. Batched states are only flushed once
+        :attr:`batch_interval` has elapsed since the last flush.
+
+        Args:
+            budget (float, optional) : Maximum time in seconds to spend publishing.
+                If ``0``, all queued states are published. Defaults to ``0``.
+
+        Returns:
+            int : Number of messages published.
+        """
+        if self.batch_states and (monotonic() - self._last_flush < self.batch_interval):
+            return 0
+
+        count = self.flush(budget, self.flush_max_messages, self.flush_max_bytes)
+        if not self.outbox:
+            count += self.flush_history()
+        return count
+
+    def flush_history(self) -> int:
+        """Publish the buffered state history of every device entity, with one
+        message per entity. See :meth:`SensorEntity.publish_history()`.
+
+        Only entities that recorded history since the last flush are visited.
+        Publishing stops at the first failure, leaving the remaining history
+        buffered for the next call.
+
+        Returns:
+            int : Number of messages published.
+        """
+        count = 0
+        for entity in list(self._history_pending.values()):
+            if entity.history:
+                try:
+                    entity.publish_history()
+                except MMQTTException as e:
+                    self.logger.warning("Unable to flush state history, %s", e.args)
+                    break
+                count += 1
+            del self._history_pending[entity.object_id]
+
+        return count
+
+    def stage_state(self, entity: SensorEntity):
+        """Add an entity's current state to the pending state batch in the
+        :attr:`outbox`.
+
+        Called by :meth:`SensorEntity.publish_state()` when :attr:`batch_states` is
+        set. If :attr:`batch_interval` has elapsed since the last flush, the batch is
+        flushed immediately.
+
+        Args:
+            entity (SensorEntity): Entity whose state should be staged.
+        """
+        self.outbox.merge(
+            self.state_topic,
+            {entity.state_key: entity.state},
+            entity.state_retain,
+            entity.state_qos,
+        )
+
+        if self.batch_interval and (
+            monotonic() - self._last_flush >= self.batch_interval
+        ):
+            self.flush_states()
+
+    def flush_states(self) -> bool:
+        """Publish all pending entity states as one merged JSON document.
+
+        If :attr:`batch_states` is set, the published document contains the latest
+        known state of every entity that has been staged, so the retained message on
+        :attr:`state_topic` always reflects the whole device. If publishing fails,
+        the pending states are kept and will be retried on the next flush.
+
+        Returns:
+            bool : :class:`True` if a merged state document was published.
+        """
+        if not self.outbox.pending(self.state_topic):
+            return False
+
+        try:
+            self._publish_state_document()
+        except MMQTTException as e:
+            self.logger.error("State batch publishing failed, %s", e.args)
+            return False
+
+        return True
+
+    def _state_document_pending(self) -> dict:
+        """Returns the state document to publish on :attr:`state_topic`."""
+        document = self.outbox.get(self.state_topic)
+        if self.batch_states:
+            document = dict(self._state_document)
+            document.update(self.outbox.get(self.state_topic))
+        return document
+
+    def _state_published(self, document: dict):
+        """Record a successfully published state document."""
+        if self.batch_states:
+            self._state_document = document
+        self._last_flush = monotonic()
+
+    def _publish_state_document(self):
+        """Publish pending states on :attr:`state_topic` and remove them from the
+        outbox."""
+        document = self._state_document_pending()
+        retain, qos = self.outbox.flags(self.state_topic)
+
+        self.logger.debug("Publishing %s states", len(document))
+        self.mqtt_client.publish(self.state_topic, dumps(document), retain, qos)
+        self.outbox.discard(self.state_topic)
+        self._state_published(document)
 
     def publish_availability(self):
         """Explicitly publishes availability of the device.
@@ -224,16 +930,46 @@ class Device:
             True,
             1,
         )
+        self.outbox.discard(self.availability_topic)
 
     def mqtt_on_connect_cb(self, mqtt_client, userdata, flags, rc):
-        """Callback for the MQTT client's :attr:`on_connect` attribute. Sends
-        announcement messages for all configured entities, publishes any outstanding
-        entity states, and publishes its own availability as :class:`True`
+        """Callback for the MQTT client's :attr:`on_connect` attribute. Publishes its
+        own availability as :class:`True`, any outstanding entity states, and
+        announcement messages for all configured entities, in that order. Messages
+        exceeding :attr:`flush_max_messages` or :attr:`flush_max_bytes` are left in
+        the :attr:`outbox` for :meth:`loop()`.
+
+        If :attr:`announce_on_birth` is set, subscribes to Home Assistant's status
+        topic, and only announces the entities on the first connection.
         """
 
         if rc:
-            self.logger.error(f"MQTT client connection error: {CONNACK_ERRORS[rc]}")
+            self.logger.error("MQTT client connection error: %s", CONNACK_ERRORS[rc])
         else:
-            self.announce()
-            self.publish_state_queue()
-            self.availability = True
+            self._availability = True
+            self.logger.warning("%s available", self.device_id)
+            self.outbox.put(
+                self.availability_topic, "online", priority=PRIORITY_AVAILABILITY
+            )
+
+            if self.announce_on_birth:
+                self.mqtt_client.subscribe(HA_STATUS_TOPIC, 1)
+                if not self._session_announced:
+                    self._session_announced = self.announce(queue=True)
+            else:
+                self.announce(queue=True)
+
+            self.flush(0, self.flush_max_messages, self.flush_max_bytes)
+            if not self.outbox:
+                self.flush_history()
+
+    def ha_status_cb(self, mqtt_client, topic, message):
+        """Callback for messages on Home Assistant's status topic. Re-announces all
+        entities and publishes any outstanding entity states when Home Assistant
+        sends its ``online`` birth message.
+        """
+
+        self.logger.info("Home Assistant status: %s", message)
+        if message == "online":
+            self._session_announced = self.announce(force=True, queue=True)
+            self.flush(0, self.flush_max_messages, self.flush_max_bytes)
@@ -6,13 +6,16 @@ from __future__ import annotations
 
 from json import dumps
 from os import getenv
+from time import monotonic
 
-import adafruit_logging as logging
 import microcontroller
 from adafruit_minimqtt.adafruit_minimqtt import MQTT, MMQTTException
 
 from . import _validators as validators
+from ._logging import getLogger
 from .const import *
+from .history import History
+from .ratelimit import TokenBucket
 
 
 class Entity(object):
@@ -33,17 +36,52 @@ class Entity(object):
         enabled_by_default (bool, optional) : Defines the number of seconds after the
             sensor's state expires, if it's not updated. After expiry, the sensor's
             state becomes unavailable. Defaults to :class:`False`.
-        mqtt_client (adafruit_minimqtt.adafruit_minimqtt.MQTT, optional) : MMQTT object for
-            communicating with Home Assistant. If the entity is a member of a device,
+        mqtt_client (adafruit_minimqtt.adafruit_minimqtt.MQTT|Transport, optional) : MMQTT
+            object or :class:`Transport` for communicating with Home Assistant. If the entity is a member of a device,
             the device's broker will be used instead.
         logger_name (str) : Name for the :class:`adafruit_logging.logger` used by this
             object. Defaults to ``'minihass'``.
+
+    Attributes:
+        COMPONENT (str) : Home Assistant component type, set by subclasses.
+        COMPONENT_CONFIG (dict) : Discovery configuration shared by every entity of
+            a subclass. Keys set in :attr:`component_config` take precedence.
     """
 
     COMPONENT = None
+    COMPONENT_CONFIG = {}
+    _chip_id = None
+
+    __slots__ = (
+        "logger",
+        "_name",
+        "_entity_category",
+        "_device_class",
+        "object_id",
+        "_icon",
+        "_enabled_by_default",
+        "_mqtt_client",
+        "_availability",
+        "_device",
+        "availability_topic",
+        "_component_config",
+        "_state_topic",
+        "_discovery_topic",
+        "_discovery_cache",
+        "_state_key",
+    )
 
     @classmethod
     def chip_id(cls):
+        """Returns the chip ID of the microcontroller as a hex string, or the
+        ``CPU_UID`` environment variable where the chip ID is not available. The
+        result is cached after the first call."""
+        if Entity._chip_id is None:
+            Entity._chip_id = cls._read_chip_id()
+        return Entity._chip_id
+
+    @staticmethod
+    def _read_chip_id():
         try:
             _chip_id = (
                 f"{int.from_bytes(microcontroller.cpu.uid, 'big'):x}"  # type: ignore
@@ -65,15 +103,18 @@ class Entity(object):
         object_id: str = "",
         icon: str = "",
         enabled_by_default: bool = True,
-        mqtt_client: MQTT | None = None,
+        mqtt_client: MQTT | Transport | None = None,  # type: ignore
         logger_name: str = "minimqtt",
         **kwargs,
     ):
         try:
             self.logger
         except AttributeError:
-            self.logger = logging.getLogger(logger_name)
-            self.logger.setLevel(getattr(logging, getenv("LOGLEVEL", ""), logging.WARNING))  # type: ignore
+            self.logger = getLogger(logger_name)
+
+        self._device = None
+        self._discovery_cache = None
+        self._state_key = None
 
         if self.__class__ == Entity:
             self.logger.error(
@@ -82,62 +123,180 @@ class Entity(object):
             raise RuntimeError("Entity class cannot be raised on its own")
 
         self.name = validators.validate_string(name, null_ok=True)
-        self.logger.debug(f"Entity name: self.name")
+        self.logger.debug("Entity name: %s", self.name)
 
         self.entity_category = validators.validate_entity_category(entity_category)
-        self.logger.debug(f"Entity category: {self.entity_category}")
+        self.logger.debug("Entity category: %s", self.entity_category)
 
         self.device_class = validators.validate_string(device_class, null_ok=True)
-        self.logger.debug(f"Entity device_class: {self.device_class}")
+        self.logger.debug("Entity device_class: %s", self.device_class)
 
         if object_id:
             self.object_id = (
                 f"{validators.validate_id_string(object_id)}{Entity.chip_id()}"
             )
             self.logger.debug(
-                f"Entity object_id: {self.object_id} (set by object_id parameter)"
+                "Entity object_id: %s (set by object_id parameter)", self.object_id
             )
         elif name:
             self.object_id = f"{validators.validate_id_string(name)}{Entity.chip_id()}"
             self.logger.debug(
-                f"Entity object_id: {self.object_id} (derived from name parameter)"
+                "Entity object_id: %s (derived from name parameter)", self.object_id
             )
         else:
             raise ValueError("One of name or object_id must be set")
 
         self.icon = validators.validate_string(icon, null_ok=True)
-        self.logger.debug(f"Entity icon: {self.icon}")
+        self.logger.debug("Entity icon: %s", self.icon)
 
         self.enabled_by_default = validators.validate_bool(enabled_by_default)
         self.logger.debug(
-            f"Entity {'enabled' if self.enabled_by_default else 'disabled'} by default"
+            "Entity %s by default", "enabled" if self.enabled_by_default else "disabled"
         )
 
         self._mqtt_client = mqtt_client
         try:
-            self.logger.debug(f"Entity MQTT client: {self._mqtt_client.broker}")  # type: ignore
+            self.logger.debug("Entity MQTT client: %s", self._mqtt_client.broker)  # type: ignore
         except AttributeError:
             self.logger.debug(
-                f"MQTT{' broker' if self._mqtt_client else '_client'} not set"
+                "MQTT%s not set", " broker" if self._mqtt_client else "_client"
             )
 
         self._availability = False
 
-        self.device: "Device" | None = None  # type: ignore
+        self.device = None
         self.availability_topic = (
             f"{HA_MQTT_PREFIX}/{self.COMPONENT}/{self.object_id}/availability"
         )
         try:
-            self.component_config
+            self._component_config
         except AttributeError:
-            self.component_config = {}
+            self._component_config = None  # Allocated on first access
 
-        self.logger.info(f"Initialized {self.COMPONENT} {self.name}: {self.object_id} ")
+        self.logger.info(
+            "Initialized %s %s: %s ", self.COMPONENT, self.name, self.object_id
+        )
 
         super().__init__(*args, **kwargs)
 
     @property
-    def mqtt_client(self) -> MQTT:
+    def name(self) -> str:
+        """Entity name. Changing this property invalidates the cached discovery
+        message."""
+        return self._name
+
+    @name.setter
+    def name(self, value: str):
+        self._name = value
+        self.invalidate_discovery()
+
+    @property
+    def icon(self) -> str:
+        """Entity icon. Changing this property invalidates the cached discovery
+        message."""
+        return self._icon
+
+    @icon.setter
+    def icon(self, value: str):
+        self._icon = value
+        self.invalidate_discovery()
+
+    @property
+    def entity_category(self) -> str:
+        """Entity category. Changing this property invalidates the cached discovery
+        message."""
+        return self._entity_category
+
+    @entity_category.setter
+    def entity_category(self, value: str):
+        self._entity_category = value
+        self.invalidate_discovery()
+
+    @property
+    def device_class(self) -> str:
+        """Entity device class. Changing this property invalidates the cached
+        discovery message."""
+        return self._device_class
+
+    @device_class.setter
+    def device_class(self, value: str):
+        self._device_class = value
+        self.invalidate_discovery()
+
+    @property
+    def enabled_by_default(self) -> bool:
+        """Whether the entity is enabled when first added. Changing this property
+        invalidates the cached discovery message."""
+        return self._enabled_by_default
+
+    @enabled_by_default.setter
+    def enabled_by_default(self, value: bool):
+        self._enabled_by_default = value
+        self.invalidate_discovery()
+
+    @property
+    def component_config(self) -> dict:
+        """Component-specific discovery configuration. Assigning this property
+        invalidates the cached discovery message; call :meth:`invalidate_discovery()`
+        after modifying it in place. Static configuration shared by all entities of
+        a class belongs in :attr:`COMPONENT_CONFIG` instead."""
+        if self._component_config is None:
+            self._component_config = {}
+        return self._component_config
+
+    @component_config.setter
+    def component_config(self, value: dict):
+        self._component_config = value
+        self.invalidate_discovery()
+
+    @property
+    def device(self) -> "Device" | None:  # type: ignore
+        """The :class:`Device` this entity is a member of, or :class:`None`. Changing
+        this property invalidates the cached discovery message."""
+        return self._device
+
+    @device.setter
+    def device(self, value: "Device" | None):  # type: ignore
+        self._device = value
+        self._update_topics()
+        self.invalidate_discovery()
+
+    def _update_topics(self):
+        """Compute the state and discovery topics, which depend on device
+        membership. The state topic is the device-level state topic if the entity is
+        a member of a device, to allow batching of state updates, or an entity-level
+        topic otherwise."""
+        if self._device:
+            self._state_topic = self._device.state_topic
+            self._discovery_topic = f"{HA_MQTT_PREFIX}/{self.COMPONENT}/{self._device.device_id}/{self.object_id}/config"
+        else:
+            self._state_topic = f"{HA_MQTT_PREFIX}/entity/{self.object_id}/state"
+            self._discovery_topic = (
+                f"{HA_MQTT_PREFIX}/{self.COMPONENT}/{self.object_id}/config"
+            )
+        self.logger.debug("State topic: %s", self._state_topic)
+
+    @property
+    def state_key(self) -> str:
+        """Key of this entity's state in JSON state payloads. This is the
+        ``object_id``, unless a short key was assigned by a :class:`Device` with
+        ``short_keys`` set."""
+        return self._state_key or self.object_id
+
+    def invalidate_discovery(self):
+        """Discard the cached discovery topic and payload, so that they are rebuilt
+        by the next :meth:`announce()`. Called automatically when a property that
+        affects the discovery message is changed."""
+        self._discovery_cache = None
+        try:
+            device = self._device
+        except AttributeError:
+            return  # Called by a property setter before __init__()
+        if device:
+            device.invalidate_discovery()
+
+    @property
+    def mqtt_client(self) -> MQTT | Transport:  # type: ignore
         """Sets or gets the MQTT client for this entity. If this entity is a member
         of a device, the device MQTT client will be returned."""
         if self.device:
@@ -146,9 +305,9 @@ class Entity(object):
             return self._mqtt_client  # type: ignore
 
     @mqtt_client.setter
-    def mqtt_client(self, client: MQTT):
+    def mqtt_client(self, client: MQTT | Transport):  # type: ignore
         self._mqtt_client = client
-        self.logger.info(f"Entity MQTT client set")
+        self.logger.info("Entity MQTT client set")
 
     @property
     def availability(self) -> bool:
@@ -165,7 +324,10 @@ class Entity(object):
         self._availability = validators.validate_bool(value)
 
         self.logger.info(
-            f"{self.COMPONENT} {self.object_id} {'available' if self._availability else 'unavailable'}"
+            "%s %s %s",
+            self.COMPONENT,
+            self.object_id,
+            "available" if self._availability else "unavailable",
         )
 
         try:
@@ -173,46 +335,32 @@ class Entity(object):
         except AttributeError:
             self.logger.warning("Unable to publish availability - MQTT client not set")
         except MMQTTException as e:
-            self.logger.error(f"Availability publishing failed, {e.args}")
+            self.logger.error("Availability publishing failed, %s", e.args)
+            if self.device:
+                self.device.outbox.put(
+                    self.availability_topic,
+                    "online" if self.availability else "offline",
+                    priority=PRIORITY_AVAILABILITY,
+                )
 
     @property
-    def _state_topic(self) -> str:
-        """Returns device-level state topic if a member of a device to allow batching
-        of state updates, returns entity-level topic otherwise"""
+    def discovery_topic(self) -> str:
+        """MQTT discovery topic for this entity. Includes the device ID if the entity
+        is a member of a device."""
+        return self._discovery_topic
 
-        state_topic = ""
-        try:
-            self.logger.debug(f"State topic from device {self.device.device_id}")  # type: ignore
-            state_topic = self.device.state_topic  # type: ignore
-        except AttributeError:
-            state_topic = f"{HA_MQTT_PREFIX}/entity/{self.object_id}/state"
+    def discovery_config(self, include_device: bool = True) -> dict:
+        """Build the MQTT discovery configuration for this entity.
 
-        self.logger.debug(f"State topic: {state_topic}")
-        return state_topic
-
-    def announce(self):
-        """Send MQTT discovery message for this entity only.
+        Args:
+            include_device (bool, optional) : Include the parent device's ``dev``
+                block, if the entity is a member of a device. Set to :class:`False`
+                when the configuration is embedded in a device discovery payload.
+                Defaults to :class:`True`.
 
-        Raises:
-            ValueError : If the entity or its parent device does not have a valid
-                ``mqtt_client`` set.
-            RuntimeError : If the MQTT client is not connected
+        Returns:
+            dict : Discovery configuration, using abbreviated keys.
         """
-
-        try:
-            self.logger.debug(f"Using MQTT broker {self.mqtt_client.broker}")
-        except AttributeError:
-            self.logger.warning("MQTT client not set")
-
-        if self.device:
-            discovery_topic = f"{HA_MQTT_PREFIX}/{self.COMPONENT}/{self.device.device_id}/{self.object_id}/config"
-        else:
-            discovery_topic = (
-                f"{HA_MQTT_PREFIX}/{self.COMPONENT}/{self.object_id}/config"
-            )
-
-        self.logger.debug(f"Discovery topic: {discovery_topic}")
-
         discovery_payload = {
             "avty": [{"t": self.availability_topic}],
             "en": self.enabled_by_default,
@@ -232,8 +380,9 @@ class Entity(object):
             discovery_payload.update({"ic": self.icon})
 
         if self.device:
-            self.logger.debug(f"Adding device config from {self.device.name}")
-            discovery_payload.update(self.device.device_config)
+            if include_device:
+                self.logger.debug("Adding device config from %s", self.device.name)
+                discovery_payload.update(self.device.device_config)
             discovery_payload["avty"].append({"t": self.device.availability_topic})
 
         try:
@@ -241,22 +390,69 @@ class Entity(object):
             discovery_payload.update(
                 {
                     "stat_t": self._state_topic,  # type: ignore
-                    "val_tpl": f"{{{{ value_json.{self.object_id} }}}}",  # type: ignore
+                    "val_tpl": (
+                        f"{{{{ value_json['{self._state_key}'] }}}}"
+                        if self._state_key
+                        else f"{{{{ value_json.{self.object_id} }}}}"
+                    ),
                 }
             )
         except AttributeError:
             pass
 
-        discovery_payload.update(self.component_config)
+        if self._component_config:
+            discovery_payload.update(self._component_config)
+        for key, value in self.COMPONENT_CONFIG.items():
+            discovery_payload.setdefault(key, value)
+
+        return discovery_payload
+
+    def discovery_message(self) -> tuple[str, str]:
+        """Returns the discovery topic and serialized discovery payload for this
+        entity. Both are cached until :meth:`invalidate_discovery()` is called.
+
+        Returns:
+            tuple[str, str] : Discovery topic and JSON payload.
+        """
+        if self._discovery_cache is None:
+            self._discovery_cache = (
+                self.discovery_topic,
+                dumps(self.discovery_config()),
+            )
+        return self._discovery_cache
+
+    def announce(self) -> bool:
+        """Send MQTT discovery message for this entity only.
+
+        Returns:
+            bool : :class:`True` if the discovery message was published.
+
+        Raises:
+            ValueError : If the entity or its parent device does not have a valid
+                ``mqtt_client`` set.
+            RuntimeError : If the MQTT client is not connected
+        """
+
+        try:
+            self.logger.debug("Using MQTT broker %s", self.mqtt_client.broker)
+        except AttributeError:
+            self.logger.warning("MQTT client not set")
+
+        discovery_topic, discovery_payload = self.discovery_message()
+        self.logger.debug("Discovery topic: %s", discovery_topic)
 
-        self.logger.info(f"Publishing discovery message for {self.object_id}")
-        self.logger.debug(f"Discovery payload: {dumps(discovery_payload)}")
+        self.logger.info("Publishing discovery message for %s", self.object_id)
+        self.logger.debug("Discovery payload: %s", discovery_payload)
         try:
-            self.mqtt_client.publish(discovery_topic, dumps(discovery_payload), True, 1)
+            self.mqtt_client.publish(discovery_topic, discovery_payload, True, 1)
         except AttributeError:
             self.logger.warning("Unable to announce: - MQTT client not set")
+            return False
         except MMQTTException as e:
-            self.logger.error(f"Announcement failed, {e.args}")
+            self.logger.error("Announcement failed, %s", e.args)
+            return False
+
+        return True
 
     def withdraw(self):
         """Send MQTT discovery message to remove this entity.
@@ -268,24 +464,17 @@ class Entity(object):
         """
 
         try:
-            self.logger.debug(f"Using MQTT broker {self.mqtt_client.broker}")
+            self.logger.debug("Using MQTT broker %s", self.mqtt_client.broker)
         except AttributeError:
             self.logger.warning("MQTT client not set")
 
-        if self.device:
-            discovery_topic = f"{HA_MQTT_PREFIX}/{self.COMPONENT}/{self.device.device_id}/{self.object_id}/config"
-        else:
-            discovery_topic = (
-                f"{HA_MQTT_PREFIX}/{self.COMPONENT}/{self.object_id}/config"
-            )
-
-        self.logger.info(f"Publishing withdrawal message for {self.object_id}")
+        self.logger.info("Publishing withdrawal message for %s", self.object_id)
         try:
-            self.mqtt_client.publish(discovery_topic, "", True, 1)
+            self.mqtt_client.publish(self.discovery_topic, "", True, 1)
         except AttributeError:
             self.logger.warning("Unable to withdraw: - MQTT client not set")
         except MMQTTException as e:
-            self.logger.error(f"Withdrawal failed, {e.args}")
+            self.logger.error("Withdrawal failed, %s", e.args)
 
     def publish_availability(self):
         """Explicitly publishes availability of the entity.
@@ -302,6 +491,8 @@ class Entity(object):
             True,
             1,
         )
+        if self.device:
+            self.device.outbox.discard(self.availability_topic)
 
 
 class SensorEntity(Entity):
@@ -315,19 +506,110 @@ class SensorEntity(Entity):
             are not queued, but can still be explicitly published by calling the
             entity's :meth:`publish_state` method. If ``"always"``, states are not
             automatically published and will alawys be queued. Defaults to
-            ``"yes"``.
+            ``"yes"``. States are always queued if the entity belongs to a
+            :class:`Device` with ``defer_states`` set.
+        suppress_unchanged (bool, optional): If :class:`True`, assigning a state
+            equal to the last published state does nothing. Defaults to
+            :class:`False`.
+        deadband (float, optional): For numeric states, changes smaller than this
+            absolute amount from the last published state are not published.
+            Defaults to ``0``.
+        relative_deadband (float, optional): For numeric states, changes smaller
+            than this fraction of the last published state are not published, e.g.
+            ``0.01`` for 1%. Defaults to ``0``.
+        min_interval (float, optional): Minimum number of seconds between state
+            publications. State changes within the interval are queued instead, and
+            the latest one is published with the queue. Defaults to ``0``.
+        rate_limit (float, optional): Maximum sustained number of state messages
+            per second. States over the limit are queued, never dropped. If ``0``,
+            the rate is not limited. Defaults to ``0``.
+        rate_burst (int, optional): Number of state messages that can be sent in a
+            burst before ``rate_limit`` applies. Defaults to ``1``.
+        history_bytes (int, optional): Size in bytes of a ring buffer recording the
+            timestamp and value of every state that couldn't be published, because
+            publishing failed or the MQTT client is disconnected. Buffered states
+            are published in bulk by :meth:`publish_history()`. If ``0``, no
+            history is kept. Defaults to ``0``.
+        history_policy ("drop_oldest"|"drop_newest", optional): Which samples to
+            discard when the history buffer is full. Defaults to ``"drop_oldest"``.
+        state_qos (int, optional): MQTT QoS level of state messages, ``0`` or
+            ``1``. QoS 0 avoids waiting for the broker's acknowledgement, and suits
+            fast-changing telemetry. Defaults to the :class:`Device`'s
+            ``state_qos``, or ``1`` for entities without a device. Queued states
+            merged with those of other entities are sent with the highest QoS
+            level of the merged states.
+        state_retain (bool, optional): MQTT retain flag of state messages.
+            Defaults to the :class:`Device`'s ``state_retain``, or :class:`True`
+            for entities without a device. Queued states merged with those of
+            other entities are retained if any of the merged states is.
+
+    .. note:: State suppression is disabled for entities with ``force_update`` set.
     """
 
-    def __init__(self, *args, queue="yes", logger_name="minimqtt", **kwargs):
+    HISTORY_TYPECODE = "f"
+
+    __slots__ = (
+        "queue",
+        "_state",
+        "_state_queued",
+        "suppress_unchanged",
+        "deadband",
+        "relative_deadband",
+        "min_interval",
+        "_reported_state",
+        "_reported_time",
+        "rate_limiter",
+        "history",
+        "_state_qos",
+        "_state_retain",
+        "_state_prefix",
+        "_state_constants",
+    )
+
+    def __init__(
+        self,
+        *args,
+        queue="yes",
+        logger_name="minimqtt",
+        suppress_unchanged: bool = False,
+        deadband: float = 0,
+        relative_deadband: float = 0,
+        min_interval: float = 0,
+        rate_limit: float = 0,
+        rate_burst: int = 1,
+        history_bytes: int = 0,
+        history_policy: str = "drop_oldest",
+        state_qos: int | None = None,
+        state_retain: bool | None = None,
+        **kwargs,
+    ):
         self.queue = validators.validate_queue_option(queue)
         self._state: object = None
-        self.state_queued: bool = False
+        self._state_queued: bool = False
+
+        self.suppress_unchanged = validators.validate_bool(suppress_unchanged)
+        self.deadband = deadband
+        self.relative_deadband = relative_deadband
+        self.min_interval = min_interval
+        self._reported_state: object = None
+        self._reported_time: float | None = None
+        self.rate_limiter = TokenBucket(rate_limit, rate_burst) if rate_limit else None
+        self.history = (
+            History(history_bytes, self.HISTORY_TYPECODE, history_policy)
+            if history_bytes
+            else None
+        )
+        self._state_qos = (
+            None if state_qos is None else validators.validate_qos(state_qos)
+        )
+        self._state_retain = (
+            None if state_retain is None else validators.validate_bool(state_retain)
+        )
 
         try:
             self.logger
         except AttributeError:
-            self.logger = logging.getLogger(logger_name)
-            self.logger.setLevel(getattr(logging, getenv("LOGLEVEL", ""), logging.WARNING))  # type: ignore
+            self.logger = getLogger(logger_name)
 
         if self.__class__ == SensorEntity:
             self.logger.error(  # type: ignore
@@ -337,36 +619,254 @@ class SensorEntity(Entity):
 
         super().__init__(*args, **kwargs)
 
+    def _update_topics(self):
+        super()._update_topics()
+        self._compile_state_template()
+
+    def _compile_state_template(self):
+        """Precompile the key prefix of the JSON state payload
+        ``{"<state_key>": <value>}``. The complete payloads for the constant values
+        ``true``, ``false`` and ``null`` are built by the first
+        :meth:`_render_state()` that needs them, so that entities which never
+        publish stay small."""
+        self._state_prefix = b'{"' + self.state_key.encode() + b'": '
+        self._state_constants = None
+
+    def _render_state(self, value) -> bytes:
+        """Render the JSON state payload for ``value`` using the precompiled
+        template. Boolean and :class:`None` states are not serialized at all, and
+        other values are serialized on their own rather than as a dictionary."""
+        prefix = self._state_prefix
+        if value is True or value is False or value is None:
+            if self._state_constants is None:
+                self._state_constants = {
+                    True: prefix + b"true}",
+                    False: prefix + b"false}",
+                    None: prefix + b"null}",
+                }
+            return self._state_constants[value]
+
+        return prefix + dumps(value).encode() + b"}"
+
+    @property
+    def state_qos(self) -> int:
+        """MQTT QoS level of state messages. Inherited from the device unless set
+        on the entity."""
+        if self._state_qos is not None:
+            return self._state_qos
+        return self.device.state_qos if self.device else 1
+
+    @property
+    def state_retain(self) -> bool:
+        """MQTT retain flag of state messages. Inherited from the device unless set
+        on the entity."""
+        if self._state_retain is not None:
+            return self._state_retain
+        return self.device.state_retain if self.device else True
+
+    @property
+    def state_queued(self) -> bool:
+        """:class:`True` if the entity has a state waiting to be published. States of
+        entities that are members of a device are queued in the device's
+        :attr:`Device.outbox`."""
+        if self.device:
+            return self.device.outbox.pending(self._state_topic, self.state_key)
+        return self._state_queued
+
+    def _connected(self) -> bool:
+        """Returns :class:`False` if the MQTT client reports that it is
+        disconnected, so queued states can't be published until it reconnects."""
+        try:
+            return self.mqtt_client.is_connected()  # type: ignore
+        except MMQTTException:
+            return False  # Raised by older MiniMQTT releases when disconnected
+        except AttributeError:
+            return True  # Assume connected if the client can't tell
+
+    def _queue_state(self, failed: bool = False):
+        """Queue the current state for publishing, replacing any state already
+        queued for this entity.
+
+        The state is only recorded in the history buffer if it couldn't be
+        published now, because publishing it ``failed`` or the MQTT client is
+        disconnected. States that are published live aren't buffered twice.
+        """
+        if self.device:
+            self.device.outbox.merge(
+                self._state_topic,
+                {self.state_key: self._state},
+                self.state_retain,
+                self.state_qos,
+            )
+        else:
+            self._state_queued = True
+
+        if (
+            self.history is not None
+            and self._state is not None
+            and (failed or not self._connected())
+        ):
+            try:
+                self.history.append(self._state)
+            except TypeError:
+                self.logger.warning("Unable to record %s history", self.object_id)
+            else:
+                if self.device:
+                    self.device._history_pending[self.object_id] = self
+
+    @property
+    def history_topic(self) -> str:
+        """Topic on which buffered state history is published."""
+        return f"{HA_MQTT_PREFIX}/entity/{self.object_id}/history"
+
+    def publish_history(self) -> bool:
+        """Publish all states in the history buffer as a single JSON array of
+        ``[timestamp, value]`` pairs on :attr:`history_topic`, oldest first, and
+        clear the buffer.
+
+        Returns:
+            bool : :class:`True` if history was published, :class:`False` if the
+                buffer is empty or disabled.
+        """
+        if not self.history:
+            return False
+
+        self.mqtt_client.publish(  # type: ignore
+            self.history_topic, dumps([list(x) for x in self.history]), False, 1
+        )
+        self.history.clear()
+        return True
+
     def _state_getter(self):
         """Gets or sets the state of a sensor entity. Setting this parameter calls
         :meth:`publish_state()`"""
         return self._state
 
+    def validate_state(self, state):
+        """Validate a new state before it is assigned, returning the state to use.
+        Subclasses override this to reject or normalize invalid states.
+
+        Raises:
+            TypeError : The state has an invalid type.
+            ValueError : The state has an invalid value.
+        """
+        return state
+
+    def _is_suppressed(self, newstate) -> bool:
+        """Returns :class:`True` if ``newstate`` should not be published, because it
+        is unchanged or within the deadband of the last published state."""
+        if self._reported_time is None or getattr(self, "force_update", False):
+            return False
+
+        last = self._reported_state
+        if (
+            (self.deadband or self.relative_deadband)
+            and isinstance(newstate, (int, float))
+            and isinstance(last, (int, float))
+            and not isinstance(newstate, bool)
+        ):
+            delta = abs(newstate - last)
+            if delta < self.deadband:
+                return True
+            if delta < abs(last) * self.relative_deadband:
+                return True
+            return False
+
+        return self.suppress_unchanged and newstate == last
+
+    def _throttled(self) -> bool:
+        """Returns :class:`True` if publishing a state now would exceed the rate
+        limit of the entity or its device. Consumes a token from both otherwise."""
+        entity_limiter = self.rate_limiter
+        device_limiter = self.device.rate_limiter if self.device else None
+
+        if entity_limiter and not entity_limiter.ready():
+            entity_limiter.throttled += 1
+            return True
+        if device_limiter and not device_limiter.consume():
+            return True
+        if entity_limiter:
+            entity_limiter.consume()
+        return False
+
     def _state_setter(self, newstate):
         self._state = newstate
 
-        if self.queue == "always":
-            self.state_queued = True
+        if self._is_suppressed(newstate):
+            self.logger.debug("%s state change suppressed", self.object_id)
+            return
+
+        now = monotonic()
+        too_soon = (
+            self.min_interval
+            and self._reported_time is not None
+            and now - self._reported_time < self.min_interval
+        )
+        if (
+            too_soon
+            or self.queue == "always"
+            or (self.device and self.device.defer_states)
+        ):
+            self._queue_state()
+        elif self._throttled():
+            self.logger.debug("%s state rate limited, queueing", self.object_id)
+            self._queue_state()
         else:
             try:
                 self.publish_state()  # type: ignore
             except Exception as e:  # TODO: Narrow exception scope
-                if self.queue in ["yes", "always"]:
-                    self.state_queued = True
                 self.logger.warning("Unable to publish state change")  # type: ignore
+                if self.queue not in ["yes", "always"]:
+                    return  # Not reported, so the same state isn't suppressed
+                self._queue_state(failed=True)
+
+        if not too_soon:
+            self._reported_state = newstate
+            self._reported_time = now
 
     state = property(_state_getter, _state_setter)
 
+    def _queue_update(self, newstate) -> bool:
+        """Set the state and queue it without publishing, as part of a bulk update
+        by :meth:`Device.update_states()`. ``newstate`` must already be validated.
+
+        Returns:
+            bool : :class:`False` if the state change was suppressed.
+        """
+        self._state = newstate
+        if self._is_suppressed(newstate):
+            return False
+
+        self._reported_state = newstate
+        self._reported_time = monotonic()
+        self._queue_state()
+        return True
+
     def publish_state(self):
         """Explicitly publishes state of the entity.
 
         This function is called automatically when :attr:`state` property is
-        changed.
+        changed. If the entity belongs to a device with
+        :attr:`Device.batch_states` set, the state is staged on the device and
+        published with the next :meth:`Device.flush_states()` instead.
         """
+        if self.device and self.device.batch_states:
+            self.device.stage_state(self)
+            return
+
+        stats = self.device.stats if self.device else None
+        if stats:
+            start = stats.start()
+
         self.mqtt_client.publish(  # type: ignore
             self._state_topic,  # type: ignore
-            dumps({self.object_id: self._state}),  # type: ignore
-            True,
-            1,
+            self._render_state(self._state),
+            self.state_retain,
+            self.state_qos,
         )
-        self.state_queued = False
+        if self.device:
+            self.device.outbox.discard(self._state_topic, self.state_key)
+        self._state_queued = False
+
+        if stats:
+            stats.record("publish_state", start)
@@ -0,0 +1,88 @@
+"""Implements a fixed-capacity ring buffer of timestamped entity states"""
+
+from array import array
+from time import time
+
+from . import _validators as validators
+
+
+class History:
+    """A ring buffer of timestamped numeric samples, preallocated to a fixed size in
+    bytes so that it never grows while the device is offline.
+
+    Timestamps are stored as whole seconds from :func:`time.time()`, and values are
+    stored in an :class:`array.array` of type ``typecode``.
+
+    Args:
+        capacity_bytes (int) : Memory to allocate for samples, in bytes. The number
+            of samples held is ``capacity_bytes`` divided by the size of a timestamp
+            plus the size of a value.
+        typecode (str, optional) : :mod:`array` typecode of the values, e.g. ``"f"``
+            for floats, ``"i"`` for integers or ``"b"`` for booleans. Defaults to
+            ``"f"``.
+        policy ("drop_oldest"|"drop_newest", optional) : What to do when the buffer
+            is full. If ``"drop_oldest"``, the oldest sample is overwritten. If
+            ``"drop_newest"``, the new sample is discarded. Defaults to
+            ``"drop_oldest"``.
+
+    Attributes:
+        capacity (int) : Maximum number of samples held.
+        dropped (int) : Number of samples discarded because the buffer was full.
+    """
+
+    def __init__(
+        self, capacity_bytes: int, typecode: str = "f", policy: str = "drop_oldest"
+    ):
+        self.policy = validators.validate_history_policy(policy)
+        self.typecode = typecode
+
+        values = array(typecode, [0])
+        timestamps = array("i", [0])
+        self.capacity = capacity_bytes // (values.itemsize + timestamps.itemsize)
+        if self.capacity < 1:
+            raise ValueError(f"Capacity of {capacity_bytes} bytes is too small")
+
+        self._values = array(typecode, [0] * self.capacity)
+        self._timestamps = array("i", [0] * self.capacity)
+        self._start = 0
+        self._len = 0
+        self.dropped = 0
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __iter__(self):
+        """Iterate over ``(timestamp, value)`` tuples, oldest first."""
+        for n in range(self._len):
+            i = (self._start + n) % self.capacity
+            yield (self._timestamps[i], self._values[i])
+
+    def append(self, value, timestamp: int | None = None) -> bool:
+        """Add a sample to the buffer.
+
+        Args:
+            value : Sample value, compatible with :attr:`typecode`.
+            timestamp (int, optional) : Sample time in seconds. Defaults to the
+                current time.
+
+        Returns:
+            bool : :class:`False` if the sample was discarded by the
+                ``"drop_newest"`` policy.
+        """
+        if self._len == self.capacity:
+            self.dropped += 1
+            if self.policy == "drop_newest":
+                return False
+            self._start = (self._start + 1) % self.capacity
+            self._len -= 1
+
+        i = (self._start + self._len) % self.capacity
+        self._values[i] = value
+        self._timestamps[i] = int(time()) if timestamp is None else timestamp
+        self._len += 1
+        return True
+
+    def clear(self):
+        """Remove all samples from the buffer."""
+        self._start = 0
+        self._len = 0
@@ -0,0 +1,174 @@
+"""Implements an in-process MQTT broker and transport, for tests and benchmarks"""
+
+from .transport import Transport, TransportError
+
+
+def topic_matches(topic_filter: str, topic: str) -> bool:
+    """Returns :class:`True` if ``topic`` matches ``topic_filter``, which may
+    contain the ``+`` and ``#`` MQTT wildcards."""
+    if topic_filter == topic:
+        return True
+
+    parts = topic.split("/")
+    for i, level in enumerate(topic_filter.split("/")):
+        if level == "#":
+            return True
+        if i >= len(parts) or (level != "+" and level != parts[i]):
+            return False
+    return len(parts) == i + 1
+
+
+def _remaining_length_size(length: int) -> int:
+    """Returns the number of bytes encoding an MQTT remaining length."""
+    size = 1
+    while length > 127:
+        length //= 128
+        size += 1
+    return size
+
+
+def publish_size(topic: str, msg, qos: int = 0) -> int:
+    """Returns the size in bytes of an MQTT 3.1.1 PUBLISH packet, plus its PUBACK
+    for QoS 1."""
+    if isinstance(msg, str):
+        msg = msg.encode()
+    length = 2 + len(topic.encode()) + len(msg) + (2 if qos else 0)
+    return 1 + _remaining_length_size(length) + length + (4 if qos else 0)
+
+
+class LoopbackBroker:
+    """An in-process MQTT broker, delivering messages between
+    :class:`LoopbackTransport` clients without a network.
+
+    Messages are delivered synchronously to every client with a matching
+    subscription, at the lower of the published and subscribed QoS levels. Retained
+    messages are stored and delivered to new subscribers, and an empty retained
+    message deletes the stored message. The Last Will and Testament of a client is
+    published if it disconnects uncleanly.
+
+    Attributes:
+        retained (dict) : Retained payloads, keyed by topic.
+        stats (dict) : Counters of ``published`` and ``delivered`` messages,
+            ``acks`` sent for QoS 1 messages, and ``wire_bytes``, the size of the
+            MQTT packets sent by clients. Reset with :meth:`reset_stats()`.
+    """
+
+    def __init__(self):
+        self.retained = {}
+        self._subscriptions = []
+        self.reset_stats()
+
+    def reset_stats(self):
+        """Reset all :attr:`stats` counters to zero."""
+        self.stats = {"published": 0, "delivered": 0, "acks": 0, "wire_bytes": 0}
+
+    def publish(self, topic: str, msg, retain: bool = False, qos: int = 0):
+        """Deliver a message to every matching subscriber, and store it if
+        ``retain`` is set."""
+        stats = self.stats
+        stats["published"] += 1
+        stats["wire_bytes"] += publish_size(topic, msg, qos)
+        if qos:
+            stats["acks"] += 1
+
+        if retain:
+            if msg:
+                self.retained[topic] = msg
+            else:
+                self.retained.pop(topic, None)
+
+        for topic_filter, client, max_qos in self._subscriptions:
+            if topic_matches(topic_filter, topic):
+                stats["delivered"] += 1
+                client._deliver(topic, msg, min(qos, max_qos))
+
+    def subscribe(self, client, topic_filter: str, qos: int = 0):
+        """Subscribe ``client`` to ``topic_filter``, then deliver matching retained
+        messages to it. Subscribing again to the same filter replaces the QoS."""
+        self.unsubscribe(client, topic_filter)
+        self._subscriptions.append((topic_filter, client, qos))
+        for topic, msg in list(self.retained.items()):
+            if topic_matches(topic_filter, topic):
+                self.stats["delivered"] += 1
+                client._deliver(topic, msg, qos)
+
+    def unsubscribe(self, client, topic_filter: str = ""):
+        """Remove the subscriptions of ``client`` to ``topic_filter``, or all of its
+        subscriptions if ``topic_filter`` is not set."""
+        self._subscriptions = [
+            x
+            for x in self._subscriptions
+            if x[1] is not client or (topic_filter and x[0] != topic_filter)
+        ]
+
+
+class LoopbackTransport(Transport):
+    """A :class:`Transport` connected to a :class:`LoopbackBroker` in the same
+    process, for tests and benchmarks. Publishing while disconnected raises
+    :class:`TransportError`, as a network client would.
+
+    Args:
+        broker (LoopbackBroker, optional) : Broker to connect to. Defaults to a new
+            broker.
+
+    Attributes:
+        loopback (LoopbackBroker) : The broker.
+        will (tuple) : Last Will and Testament ``(topic, payload, qos, retain)``, or
+            :class:`None`.
+        connected (bool) : :class:`True` after :meth:`connect()`.
+        received (list) : ``(topic, message, qos)`` tuples of messages delivered
+            to the client, if ``record`` is set.
+    """
+
+    broker = "loopback"
+
+    def __init__(self, broker: LoopbackBroker | None = None, record: bool = False):
+        self.loopback = broker if broker is not None else LoopbackBroker()
+        self.will = None
+        self.connected = False
+        self.received = [] if record else None
+        self._callbacks = {}
+
+    def connect(self):
+        """Connect to the broker, calling :attr:`on_connect`."""
+        self.connected = True
+        if self.on_connect:
+            self.on_connect(self, None, {}, 0)
+
+    def disconnect(self, clean: bool = True):
+        """Disconnect from the broker, dropping all subscriptions. If ``clean`` is
+        :class:`False`, the connection is treated as lost and the broker publishes
+        the client's :attr:`will`."""
+        self.connected = False
+        self.loopback.unsubscribe(self)
+        if not clean and self.will:
+            topic, payload, qos, retain = self.will
+            self.loopback.publish(topic, payload, retain, qos)
+
+    def publish(self, topic, msg, retain=False, qos=0):
+        if not self.connected:
+            raise TransportError("Not connected to the loopback broker")
+        self.loopback.publish(topic, msg, retain, qos)
+
+    def is_connected(self):
+        return self.connected
+
+    def will_set(self, topic, payload, qos=0, retain=False):
+        self.will = (topic, payload, qos, retain)
+
+    def subscribe(self, topic, qos=0):
+        if not self.connected:
+            raise TransportError("Not connected to the loopback broker")
+        self.loopback.subscribe(self, topic, qos)
+
+    def add_topic_callback(self, topic, method):
+        self._callbacks[topic] = method
+
+    def _deliver(self, topic: str, msg, qos: int = 0):
+        if isinstance(msg, bytes):
+            msg = msg.decode()
+        if self.received is not None:
+            self.received.append((topic, msg, qos))
+        for topic_filter, method in self._callbacks.items():
+            if topic_matches(topic_filter, topic):
+                method(self, topic, msg)
@@ -0,0 +1,313 @@
+"""Implements an outbox of pending MQTT messages, keyed by topic"""
+
+from json import dumps, loads
+from os import remove, rename
+
+try:
+    from os import fsync
+except ImportError:
+    pass  # Not available on CircuitPython
+
+try:
+    from os import sync
+except ImportError:
+    pass  # Not available on Windows, which has fsync
+
+from .const import *
+
+
+class Outbox:
+    """A store of messages waiting to be published, holding at most one message per
+    topic. Putting a message on a topic that already has a pending message replaces
+    it, so the size of the outbox is bounded by the number of topics rather than the
+    rate of updates, and flushing it sends exactly one message per topic.
+
+    Messages can either be plain payloads, or JSON objects that are merged key by key
+    with any pending object on the same topic. The latter is used for device-level
+    state topics shared by several entities.
+
+    Each message has a priority. Messages are published in priority order, so that
+    availability reaches Home Assistant before states, and states before discovery
+    messages.
+    """
+
+    def __init__(self):
+        self._messages = {}
+
+    def __len__(self) -> int:
+        return len(self._messages)
+
+    def __contains__(self, topic: str) -> bool:
+        return topic in self._messages
+
+    @property
+    def topics(self) -> list[str]:
+        """A list of topics with pending messages, in priority order. Topics with
+        the same priority are listed in the order they were first queued."""
+        return sorted(self._messages, key=lambda t: self._messages[t][3])
+
+    def put(
+        self,
+        topic: str,
+        payload: str,
+        retain: bool = True,
+        qos: int = 1,
+        priority: int = PRIORITY_STATE,
+    ):
+        """Queue a message, replacing any pending message on the same topic.
+
+        Args:
+            topic (str) : Topic to publish to.
+            payload (str) : Message payload.
+            retain (bool, optional) : MQTT retain flag. Defaults to :class:`True`.
+            qos (int, optional) : MQTT QoS level. Defaults to ``1``.
+            priority (int, optional) : Publishing priority, lower values are
+                published first. Defaults to ``PRIORITY_STATE``.
+        """
+        self._messages[topic] = [payload, retain, qos, priority]
+
+    def merge(
+        self,
+        topic: str,
+        values: dict,
+        retain: bool = True,
+        qos: int = 1,
+        priority: int = PRIORITY_STATE,
+    ):
+        """Queue a JSON object message, merging ``values`` into any pending object on
+        the same topic. Newer values replace older values with the same key. The
+        merged message is retained if any of the merged messages is, and is sent
+        with the highest of their QoS levels.
+
+        Args:
+            topic (str) : Topic to publish to.
+            values (dict) : Keys and values to merge into the pending object.
+            retain (bool, optional) : MQTT retain flag. Defaults to :class:`True`.
+            qos (int, optional) : MQTT QoS level. Defaults to ``1``.
+            priority (int, optional) : Publishing priority, lower values are
+                published first. Defaults to ``PRIORITY_STATE``.
+        """
+        message = self._messages.get(topic)
+        if message and isinstance(message[0], dict):
+            message[0].update(values)
+            message[1] = message[1] or retain
+            message[2] = max(message[2], qos)
+            message[3] = priority
+        else:
+            self._messages[topic] = [dict(values), retain, qos, priority]
+
+    def get(self, topic: str):
+        """Returns the pending payload for ``topic``, or :class:`None`."""
+        message = self._messages.get(topic)
+        return message[0] if message else None
+
+    def flags(self, topic: str) -> tuple[bool, int]:
+        """Returns the retain flag and QoS level of the pending message on
+        ``topic``."""
+        message = self._messages[topic]
+        return message[1], message[2]
+
+    def priority(self, topic: str) -> int:
+        """Returns the priority of the pending message on ``topic``."""
+        return self._messages[topic][3]
+
+    def pending(self, topic: str, key: str = "") -> bool:
+        """Returns :class:`True` if a message is pending on ``topic``. If ``key`` is
+        set, only returns :class:`True` if the pending object contains ``key``."""
+        message = self._messages.get(topic)
+        if not message:
+            return False
+        if key:
+            return isinstance(message[0], dict) and key in message[0]
+        return True
+
+    def discard(self, topic: str, key: str = ""):
+        """Remove the pending message on ``topic``. If ``key`` is set, only that key
+        is removed from the pending object, and the message is removed once empty."""
+        message = self._messages.get(topic)
+        if not message:
+            return
+        if key:
+            if isinstance(message[0], dict):
+                message[0].pop(key, None)
+                if message[0]:
+                    return
+            else:
+                return
+        del self._messages[topic]
+
+    def clear(self):
+        """Remove all pending messages."""
+        self._messages = {}
+
+    def sync(self):
+        """Write pending changes to storage. Does nothing for an in-memory outbox."""
+
+    def message(self, topic: str) -> tuple[str, bool, int]:
+        """Returns the serialized payload, retain flag and QoS level of the pending
+        message on ``topic``."""
+        payload, retain, qos, _ = self._messages[topic]
+        if isinstance(payload, dict):
+            payload = dumps(payload)
+        return payload, retain, qos
+
+
+class FileOutbox(Outbox):
+    """An :class:`Outbox` that persists its pending messages to a file, so they
+    survive a reboot or power loss and can be published after restarting.
+
+    Only state messages are persisted. Availability and discovery messages are
+    rebuilt from the device configuration on every connection, so they are kept in
+    memory, sparing the flash a write per message on every reconnect.
+
+    Every change is appended to the file as a compact JSON record. Writes are only
+    synced to storage every ``sync_every`` records, or when :meth:`sync()` is
+    called, to limit flash wear and latency. Once the log holds ``compact_after``
+    records, it is rewritten with one record per pending topic. The compacted log
+    is written to a temporary file that then replaces the log, so a power loss
+    during compaction leaves either the old or the new log intact.
+
+    .. note:: On CircuitPython, the filesystem must be remounted as writable by the
+        code running on the board, e.g. with ``storage.remount("/", False)`` in
+        ``boot.py``.
+
+    Args:
+        path (str) : Path of the log file. Existing records are replayed.
+        sync_every (int, optional) : Number of records to buffer before syncing
+            the file to storage. Defaults to ``8``.
+        compact_after (int, optional) : Number of appended records after which the
+            log is compacted. Defaults to ``128``.
+    """
+
+    def __init__(self, path: str, sync_every: int = 8, compact_after: int = 128):
+        super().__init__()
+        self.path = path
+        self.sync_every = sync_every
+        self.compact_after = compact_after
+        self._unsynced = 0
+        self._records = 0
+
+        # A truncated record must be dropped before appending, but an intact log
+        # that is still small is appended to as it is, sparing a rewrite per boot
+        if self._replay() or self._records >= compact_after:
+            self.compact()
+        else:
+            self._file = open(self.path, "a")
+
+    def _replay(self) -> bool:
+        """Rebuild pending messages from the log file.
+
+        Returns:
+            bool : :class:`True` if the log ends with a truncated record, and
+                must be compacted before appending to it.
+        """
+        try:
+            f = open(self.path, "r")
+        except OSError:
+            try:  # Compaction was interrupted before the log was replaced
+                f = open(self.path + ".tmp", "r")
+            except OSError:
+                return False
+
+        with f:
+            for line in f:
+                try:
+                    record = loads(line)
+                except ValueError:
+                    return True  # Truncated by power loss, ignore the rest
+                self._records += 1
+                op = record[0]
+                if op == "p":
+                    super().put(*record[1:])
+                elif op == "m":
+                    super().merge(*record[1:])
+                elif op == "d":
+                    super().discard(*record[1:])
+                elif op == "c":
+                    super().clear()
+                if not line.endswith("\n"):
+                    return True  # Appending would extend the last record
+        return False
+
+    def _append(self, record: list):
+        self._file.write(dumps(record))
+        self._file.write("\n")
+        self._records += 1
+        self._unsynced += 1
+
+        if self._records >= self.compact_after:
+            self.compact()
+        elif self._unsynced >= self.sync_every:
+            self.sync()
+
+    def sync(self):
+        """Write any buffered records to storage."""
+        self._file.flush()
+        try:
+            fsync(self._file.fileno())
+        except (AttributeError, NameError):
+            sync()  # CircuitPython has no fsync
+        self._unsynced = 0
+
+    def compact(self):
+        """Rewrite the log file with one record per pending message."""
+        try:
+            self._file.close()
+        except AttributeError:
+            pass
+
+        temp_path = self.path + ".tmp"
+        self._file = open(temp_path, "w")
+        for topic, (payload, retain, qos, priority) in self._messages.items():
+            if priority != PRIORITY_STATE:
+                continue
+            op = "m" if isinstance(payload, dict) else "p"
+            self._file.write(dumps([op, topic, payload, retain, qos, priority]))
+            self._file.write("\n")
+        self.sync()
+        self._file.close()
+        try:
+            rename(temp_path, self.path)
+        except OSError:
+            remove(self.path)  # FAT filesystems can't rename over a file
+            rename(temp_path, self.path)
+
+        self._file = open(self.path, "a")
+        self._records = 0
+
+    def _journaled(self, topic: str) -> bool:
+        """Returns :class:`True` if the pending message on ``topic`` is persisted."""
+        message = self._messages.get(topic)
+        return message is not None and message[3] == PRIORITY_STATE
+
+    def put(self, topic, payload, retain=True, qos=1, priority=PRIORITY_STATE):
+        journaled = self._journaled(topic)
+        super().put(topic, payload, retain, qos, priority)
+        if priority == PRIORITY_STATE:
+            self._append(["p", topic, payload, retain, qos, priority])
+        elif journaled:
+            self._append(["d", topic, ""])  # Replaced by an unpersisted message
+
+    def merge(self, topic, values, retain=True, qos=1, priority=PRIORITY_STATE):
+        journaled = self._journaled(topic)
+        super().merge(topic, values, retain, qos, priority)
+        if priority == PRIORITY_STATE:
+            self._append(["m", topic, values, retain, qos, priority])
+        elif journaled:
+            self._append(["d", topic, ""])
+
+    def discard(self, topic, key=""):
+        if self._journaled(topic):
+            super().discard(topic, key)
+            self._append(["d", topic, key])
+        else:
+            super().discard(topic, key)
+
+    def clear(self):
+        super().clear()
+        self._append(["c"])
+
+    def close(self):
+        """Sync and close the log file."""
+        self.sync()
+        self._file.close()
@@ -0,0 +1,63 @@
+"""Implements a :class:`Transport` adapter for paho-mqtt clients on CPython hosts"""
+
+from .transport import Transport, TransportError
+
+
+class PahoTransport(Transport):
+    """A :class:`Transport` for a `paho-mqtt`_ client, for running minihass on
+    CPython hosts. The client should use version 1 of paho's callback API, and must
+    be connected and have its network loop started, e.g. with ``loop_start()``,
+    after creating the :class:`Device`.
+
+    Publishing errors reported by paho are raised as :class:`TransportError`.
+    Messages are handed to paho's network loop without waiting for the broker's
+    acknowledgement.
+
+    .. _paho-mqtt: https://pypi.org/project/paho-mqtt/
+
+    Args:
+        mqtt_client (paho.mqtt.client.Client) : Paho client.
+    """
+
+    def __init__(self, mqtt_client):
+        self.client = mqtt_client
+        self._on_connect = None
+
+    @property
+    def broker(self):
+        return getattr(self.client, "host", None) or getattr(self.client, "_host", None)
+
+    @property
+    def on_connect(self):
+        return self._on_connect
+
+    @on_connect.setter
+    def on_connect(self, method):
+        self._on_connect = method
+        self.client.on_connect = lambda client, userdata, flags, rc: method(
+            self, userdata, flags, rc
+        )
+
+    def publish(self, topic, msg, retain=False, qos=0):
+        info = self.client.publish(topic, msg, qos, retain)
+        if info.rc:
+            raise TransportError(f"Publishing to {topic} failed, paho error {info.rc}")
+
+    def is_connected(self):
+        return self.client.is_connected()
+
+    def will_set(self, topic, payload, qos=0, retain=False):
+        self.client.will_set(topic, payload, qos, retain)
+
+    def subscribe(self, topic, qos=0):
+        result, _ = self.client.subscribe(topic, qos)
+        if result:
+            raise TransportError(f"Subscribing to {topic} failed, paho error {result}")
+
+    def add_topic_callback(self, topic, method):
+        self.client.message_callback_add(
+            topic,
+            lambda client, userdata, message: method(
+                self, message.topic, message.payload.decode()
+            ),
+        )
@@ -0,0 +1,59 @@
+"""Implements token bucket rate limiting for published messages"""
+
+from time import monotonic
+
+
+class TokenBucket:
+    """A token bucket rate limiter.
+
+    The bucket holds up to ``burst`` tokens and is refilled at ``rate`` tokens per
+    second. Each message consumes one token; a message is over the limit when the
+    bucket is empty.
+
+    Args:
+        rate (float) : Sustained number of messages allowed per second.
+        burst (int, optional) : Maximum number of messages allowed in a burst.
+            Defaults to ``1``.
+
+    Attributes:
+        rate (float) : Refill rate in tokens per second.
+        burst (int) : Bucket capacity.
+        throttled (int) : Number of times a message was over the limit.
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        if rate <= 0:
+            raise ValueError(f"Rate must be positive, got {rate}")
+        if burst < 1:
+            raise ValueError(f"Burst must be at least 1, got {burst}")
+
+        self.rate = rate
+        self.burst = burst
+        self.throttled = 0
+        self._tokens = float(burst)
+        self._last = monotonic()
+
+    def _refill(self):
+        now = monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def ready(self) -> bool:
+        """Returns :class:`True` if a token is available, without consuming it."""
+        self._refill()
+        return self._tokens >= 1
+
+    def consume(self) -> bool:
+        """Consume a token if one is available.
+
+        Returns:
+            bool : :class:`True` if a token was consumed, :class:`False` if the
+                message is over the limit. :attr:`throttled` is incremented when
+                :class:`False` is returned.
+        """
+        if self.ready():
+            self._tokens -= 1
+            return True
+
+        self.throttled += 1
+        return False
@@ -0,0 +1,177 @@
+"""Implements opt-in publishing and memory instrumentation for devices"""
+
+try:
+    from gc import mem_alloc  # CircuitPython and MicroPython
+except ImportError:
+    mem_alloc = None
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+
+def _allocated() -> int | None:
+    """Returns the current heap allocation counter, or :class:`None` if allocations
+    can't be measured. On CPython, :mod:`tracemalloc` must be tracing."""
+    if mem_alloc is not None:
+        return mem_alloc()
+    if tracemalloc is not None and tracemalloc.is_tracing():
+        # The current size, not the peak, so that tracemalloc's global peak is left
+        # alone for other measurements, e.g. by benchmarks or nested operations
+        return tracemalloc.get_traced_memory()[0]
+    return None
+
+
+def _allocated_since(start: int) -> int:
+    """Returns the growth of the heap since :func:`_allocated()` returned
+    ``start``."""
+    if mem_alloc is not None:
+        return mem_alloc() - start
+    return tracemalloc.get_traced_memory()[0] - start
+
+
+class _CountingClient:
+    """Wraps the MQTT client of a :class:`Device` to count the messages published
+    through it. Everything else is forwarded to the real client."""
+
+    def __init__(self, mqtt_client, stats: "Stats"):
+        object.__setattr__(self, "_client", mqtt_client)
+        object.__setattr__(self, "_stats", stats)
+
+    def publish(self, topic: str, msg, retain: bool = False, qos: int = 0):
+        try:
+            result = self._client.publish(topic, msg, retain, qos)
+        except Exception:
+            self._stats.failures += 1
+            raise
+        self._stats.publishes += 1
+        self._stats.bytes_sent += len(topic) + len(msg)
+        return result
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._client, name, value)
+
+
+class Stats:
+    """Counters describing the traffic and memory use of a :class:`Device`, enabled
+    with its ``stats`` parameter.
+
+    Messages are counted by wrapping the device's MQTT client, so every message
+    published by the device or its entities is included. Allocations are measured
+    for :meth:`Device.announce()`, :meth:`Device.flush()` and
+    :meth:`SensorEntity.publish_state()`, using :func:`gc.mem_alloc` on
+    CircuitPython, or :mod:`tracemalloc` on CPython while it is tracing. Other
+    operations, such as creating entities, can be measured with :meth:`start()` and
+    :meth:`record()`::
+
+        start = device.stats.start()
+        sensor = BinarySensor(name="door")
+        device.stats.record("entity_init", start)
+
+    .. note:: An allocation delta is the net growth of the heap during the
+        operation. Temporary objects freed before it returns aren't counted, and on
+        CircuitPython, the delta is understated if a garbage collection runs.
+
+    Args:
+        outbox (Outbox, optional) : Outbox whose size is reported as
+            :attr:`queue_depth`. Defaults to :class:`None`.
+
+    Attributes:
+        publishes (int) : Messages published.
+        bytes_sent (int) : Topic and payload bytes published.
+        failures (int) : Messages that raised an exception when published.
+        announces (int) : Calls to :meth:`Device.announce()`.
+        reannounces (int) : Discovery messages published again for a topic that was
+            already announced, e.g. because the configuration changed or
+            :attr:`Device.skip_unchanged` isn't set.
+        max_queue_depth (int) : Largest number of queued messages seen by
+            :meth:`Device.flush()`.
+        allocations (dict) : ``[calls, total bytes, maximum bytes]`` allocated per
+            call, keyed by operation name.
+    """
+
+    def __init__(self, outbox=None):
+        self.outbox = outbox
+        self._discovery_topics = set()
+        self.reset()
+
+    def reset(self):
+        """Reset all counters to zero."""
+        self.publishes = 0
+        self.bytes_sent = 0
+        self.failures = 0
+        self.announces = 0
+        self.reannounces = 0
+        self.max_queue_depth = 0
+        self.allocations = {}
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of messages currently waiting in the outbox."""
+        return len(self.outbox) if self.outbox is not None else 0
+
+    def wrap(self, mqtt_client):
+        """Returns a wrapper around ``mqtt_client`` that counts published
+        messages."""
+        return _CountingClient(mqtt_client, self)
+
+    def discovery_published(self, topic: str):
+        """Count a discovery message published on ``topic``, as a re-announcement
+        if a discovery message was already published on it."""
+        if topic in self._discovery_topics:
+            self.reannounces += 1
+        else:
+            self._discovery_topics.add(topic)
+
+    def start(self) -> int | None:
+        """Start measuring the allocations of an operation.
+
+        Returns:
+            int : Token to pass to :meth:`record()`, or :class:`None` if allocations
+                can't be measured.
+        """
+        return _allocated()
+
+    def record(self, name: str, start: int | None):
+        """Record the bytes allocated since :meth:`start()` returned ``start``.
+
+        Args:
+            name (str) : Operation name.
+            start (int) : Value returned by :meth:`start()`. If :class:`None`,
+                nothing is recorded.
+        """
+        if start is None:
+            return
+        allocated = _allocated_since(start)
+        entry = self.allocations.get(name)
+        if entry is None:
+            self.allocations[name] = [1, allocated, allocated]
+        else:
+            entry[0] += 1
+            entry[1] += allocated
+            if allocated > entry[2]:
+                entry[2] = allocated
+
+    def allocated_per_call(self, name: str) -> float:
+        """Returns the mean bytes allocated per call of operation ``name``, or ``0``
+        if it hasn't been recorded."""
+        entry = self.allocations.get(name)
+        return entry[1] / entry[0] if entry else 0
+
+    def as_dict(self) -> dict:
+        """Returns all counters as a :class:`dict`, e.g. for logging or publishing
+        as JSON."""
+        return {
+            "publishes": self.publishes,
+            "bytes_sent": self.bytes_sent,
+            "failures": self.failures,
+            "announces": self.announces,
+            "reannounces": self.reannounces,
+            "queue_depth": self.queue_depth,
+            "max_queue_depth": self.max_queue_depth,
+            "allocations": {k: list(v) for k, v in self.allocations.items()},
+        }
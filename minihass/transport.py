@@ -0,0 +1,104 @@
+"""Implements the MQTT transport interface used by devices and entities, and its
+adapter for MiniMQTT clients. Adapters for other clients are in their own modules,
+so that they are only loaded where they are used"""
+
+from adafruit_minimqtt.adafruit_minimqtt import MQTT, MMQTTException
+
+
+class TransportError(MMQTTException):
+    """Raised by a :class:`Transport` when a message can't be sent. Subclasses
+    :class:`MMQTTException`, so failures are handled the same way for every
+    transport."""
+
+
+class Transport:
+    """The MQTT client interface used by :class:`Device` and :class:`Entity`.
+
+    This is the subset of :class:`adafruit_minimqtt.adafruit_minimqtt.MQTT` that
+    minihass relies on, so a MiniMQTT client can be used directly. Other clients are
+    used through an adapter implementing this interface.
+
+    Attributes:
+        broker (str) : Broker host name, used for logging.
+        on_connect (callable) : Called as ``on_connect(client, userdata, flags, rc)``
+            once connected to the broker, where ``rc`` is the CONNACK return code.
+    """
+
+    broker = None
+    on_connect = None
+
+    def publish(self, topic: str, msg, retain: bool = False, qos: int = 0):
+        """Publish a message.
+
+        Args:
+            topic (str) : Topic to publish to.
+            msg (str|bytes) : Message payload.
+            retain (bool, optional) : MQTT retain flag. Defaults to :class:`False`.
+            qos (int, optional) : MQTT QoS level. Defaults to ``0``.
+
+        Raises:
+            MMQTTException : The message couldn't be sent.
+        """
+        raise NotImplementedError
+
+    def is_connected(self) -> bool:
+        """Returns :class:`False` if the client knows it is disconnected from the
+        broker. Transports that can't tell return :class:`True`."""
+        return True
+
+    def will_set(self, topic: str, payload, qos: int = 0, retain: bool = False):
+        """Set the Last Will and Testament message, before connecting."""
+        raise NotImplementedError
+
+    def subscribe(self, topic: str, qos: int = 0):
+        """Subscribe to a topic."""
+        raise NotImplementedError
+
+    def add_topic_callback(self, topic: str, method):
+        """Call ``method(client, topic, message)`` for messages received on
+        ``topic``, with the message payload decoded to :class:`str`."""
+        raise NotImplementedError
+
+
+class MiniMQTTTransport(Transport):
+    """A :class:`Transport` for an :class:`adafruit_minimqtt.adafruit_minimqtt.MQTT`
+    client. MiniMQTT clients implement the interface natively, so this adapter only
+    delegates to the client; it is useful where an explicit :class:`Transport` is
+    wanted.
+
+    Args:
+        mqtt_client (adafruit_minimqtt.adafruit_minimqtt.MQTT) : MiniMQTT client.
+    """
+
+    def __init__(self, mqtt_client: MQTT):
+        self.client = mqtt_client
+
+    @property
+    def broker(self):
+        return self.client.broker
+
+    @property
+    def on_connect(self):
+        return self.client.on_connect
+
+    @on_connect.setter
+    def on_connect(self, method):
+        self.client.on_connect = method
+
+    def publish(self, topic, msg, retain=False, qos=0):
+        self.client.publish(topic, msg, retain, qos)
+
+    def is_connected(self):
+        try:
+            return self.client.is_connected()
+        except MMQTTException:
+            return False  # Raised by older MiniMQTT releases when disconnected
+
+    def will_set(self, topic, payload, qos=0, retain=False):
+        self.client.will_set(topic, payload, qos, retain)
+
+    def subscribe(self, topic, qos=0):
+        self.client.subscribe(topic, qos)
+
+    def add_topic_callback(self, topic, method):
+        self.client.add_topic_callback(topic, method)
@@ -0,0 +1,160 @@
+import asyncio
+from unittest.mock import AsyncMock, Mock, PropertyMock, patch
+
+import pytest
+from adafruit_minimqtt.adafruit_minimqtt import MQTT, MMQTTException
+
+import minihass
+from minihass.aio import AsyncDevice
+
+
+@pytest.fixture
+def entities():
+    yield [minihass.BinarySensor(name="foo"), minihass.BinarySensor(name="bar")]
+
+
+@pytest.fixture
+def mqtt_client():
+    mqtt_client = Mock(spec=MQTT)
+    mqtt_client.publish = AsyncMock()
+    mqtt_client.broker = PropertyMock(return_value="broker.example.com")
+
+    yield mqtt_client
+
+
+def test_AsyncDevice_never_publishes_inline(entities, mqtt_client):
+    o = AsyncDevice(mqtt_client, entities=entities)
+    o.availability = True
+    entities[0].state = True
+    mqtt_client.publish.assert_not_called()
+    assert o.device.defer_states
+    assert mqtt_client.on_connect == o.device.mqtt_on_connect_cb
+
+    assert asyncio.run(o.flush()) == 4
+    topics = [c.args[0] for c in mqtt_client.publish.await_args_list]
+    assert topics == [
+        "homeassistant/device/mqtt_device1337d00d/availability",
+        "homeassistant/device/mqtt_device1337d00d/state",
+        "homeassistant/binary_sensor/mqtt_device1337d00d/foo1337d00d/config",
+        "homeassistant/binary_sensor/mqtt_device1337d00d/bar1337d00d/config",
+    ]
+    assert asyncio.run(o.flush()) == 0
+
+
+def test_AsyncDevice_awaitables(entities, mqtt_client):
+    o = AsyncDevice(mqtt_client, entities=entities)
+    asyncio.run(o.flush())
+    mqtt_client.publish.reset_mock()
+
+    assert asyncio.run(o.announce(force=True))
+    assert mqtt_client.publish.await_count == 2
+    entities[1].state = False
+    assert asyncio.run(o.publish_state())
+    mqtt_client.publish.assert_awaited_with(
+        "homeassistant/device/mqtt_device1337d00d/state",
+        '{"bar1337d00d": false}',
+        True,
+        1,
+    )
+    assert asyncio.run(o.publish_availability())
+    mqtt_client.publish.assert_awaited_with(
+        "homeassistant/device/mqtt_device1337d00d/availability", "offline", True, 1
+    )
+
+
+def test_AsyncDevice_sync_client(entities):
+    mqtt_client = Mock(spec=MQTT)
+    mqtt_client.publish.return_value = None
+    o = AsyncDevice(mqtt_client, entities=entities)
+    assert asyncio.run(o.publish_state(entities[0])) is True
+    assert mqtt_client.publish.call_count == 3
+
+
+def test_AsyncDevice_failure_retried(entities, mqtt_client):
+    o = AsyncDevice(mqtt_client, entities=entities)
+    mqtt_client.publish.side_effect = MMQTTException
+    assert asyncio.run(o.flush()) == 0
+    assert not asyncio.run(o.announce())
+    mqtt_client.publish.side_effect = None
+    assert asyncio.run(o.flush()) == 2
+
+
+def test_AsyncDevice_background_task(entities, mqtt_client):
+    async def main():
+        o = AsyncDevice(mqtt_client, entities=entities, flush_interval=0.01)
+        task = o.start()
+        assert o.start() is task
+        entities[0].state = True
+        await asyncio.sleep(0.05)
+        await o.stop()
+        assert task.cancelled()
+
+    asyncio.run(main())
+    mqtt_client.publish.assert_any_await(
+        "homeassistant/device/mqtt_device1337d00d/state",
+        '{"foo1337d00d": true}',
+        True,
+        1,
+    )
+
+
+def test_AsyncDevice_state_documents_merged(entities, mqtt_client):
+    o = AsyncDevice(mqtt_client, entities=entities)
+    entities[0].state = True
+    o.device.flush()  # Queued for sending, not yet sent
+    entities[1].state = False
+    assert asyncio.run(o.publish_state(entities[1]))
+    mqtt_client.publish.assert_any_await(
+        "homeassistant/device/mqtt_device1337d00d/state",
+        '{"foo1337d00d": true, "bar1337d00d": false}',
+        True,
+        1,
+    )
+
+
+def test_AsyncDevice_announced_once_sent(entities, mqtt_client, tmp_path):
+    cache = str(tmp_path / "announced.json")
+    mqtt_client.publish.side_effect = MMQTTException
+    o = AsyncDevice(
+        mqtt_client,
+        entities=entities,
+        skip_unchanged=True,
+        announce_cache_file=cache,
+    )
+    assert not asyncio.run(o.announce())
+    assert not o.device._announced
+    mqtt_client.publish.side_effect = None
+    assert asyncio.run(o.announce())
+    assert len(o.device._announced) == 2
+    mqtt_client.publish.reset_mock()
+    assert asyncio.run(o.announce())
+    mqtt_client.publish.assert_not_called()  # Unchanged since sent
+
+
+@patch("adafruit_logging.Logger.warning")
+def test_AsyncDevice_client_exception(logger, entities, mqtt_client):
+    async def main():
+        o = AsyncDevice(mqtt_client, entities=entities, flush_interval=0.01)
+        mqtt_client.publish.side_effect = ConnectionError("reset")
+        task = o.start()
+        await asyncio.sleep(0.03)
+        assert not task.done()  # Still running after failures
+        mqtt_client.publish.side_effect = None
+        await asyncio.sleep(0.03)
+        await o.stop()
+        return o
+
+    o = asyncio.run(main())
+    logger.assert_any_call("Unable to flush state queue, ('reset',)")
+    assert not o._sent
+
+
+def test_AsyncDevice_flush_limits(entities, mqtt_client):
+    o = AsyncDevice(mqtt_client, entities=entities, flush_max_messages=1)
+    o.availability = True
+    assert asyncio.run(o.flush()) == 1
+    assert len(o._sent) == 2
+    o.device.flush_max_messages = 0
+    o.device.flush_max_bytes = 1
+    assert asyncio.run(o.flush()) == 1  # At least one message is sent
+    assert asyncio.run(o.flush(budget=1)) == 1
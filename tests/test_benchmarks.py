@@ -0,0 +1,20 @@
+from benchmarks import run
+
+
+def test_benchmarks_run():
+    report = run.run(sizes=[2])
+    assert report["minihass"]
+    assert [r["benchmark"] for r in report["results"]] == list(run.BENCHMARKS)
+    for result in report["results"]:
+        assert result["entities"] == 2
+        assert result["messages"] > 0
+        assert result["wire_bytes"] > 0
+
+
+def test_benchmarks_compare():
+    old = run.run(sizes=[1], benchmarks=["state_updates"])["results"]
+    new = [dict(old[0], wire_bytes=old[0]["wire_bytes"] + 1)]
+    assert run.compare(old, old, 0.25) == []
+    assert run.compare(new, old, 0.25) == [
+        f"state_updates[1] wire_bytes: {old[0]['wire_bytes']} -> {new[0]['wire_bytes']}"
+    ]
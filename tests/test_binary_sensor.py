@@ -1,4 +1,5 @@
 import os
+import tracemalloc
 from email.iterators import body_line_iterator
 from inspect import signature
 from unittest.mock import MagicMock, Mock, PropertyMock, patch
@@ -41,8 +42,38 @@ def test_Entity_instantiation(binary_sensor):
 def test_Entity_state(binary_sensor):
     """Test publishing of MQTT dicsovery messages"""
     expected_topic = "homeassistant/entity/foo1337d00d/state"
-    expected_msg = '{"foo1337d00d": true}'
+    expected_msg = b'{"foo1337d00d": true}'
     binary_sensor.state = "yes"
     binary_sensor.mqtt_client.publish.assert_called_with(
         expected_topic, expected_msg, True, 1
     )
+
+
+def test_BinarySensor_force_update_not_suppressed(mqtt_client):
+    s = minihass.BinarySensor(
+        name="foo", force_update=True, suppress_unchanged=True, mqtt_client=mqtt_client
+    )
+    s.state = True
+    s.state = True
+    assert mqtt_client.publish.call_count == 2
+
+
+def test_BinarySensor_slots(binary_sensor):
+    assert not hasattr(binary_sensor, "__dict__")
+    assert not hasattr(minihass.Device(mqtt_client=Mock(spec=MQTT)), "__dict__")
+    assert binary_sensor.discovery_config()["pl_on"] is True
+    assert "pl_on" not in binary_sensor.component_config  # Shared at class level
+    assert binary_sensor.component_config == {"expire_after": 1}
+    assert minihass.BinarySensor(name="bar")._component_config is None
+
+
+def test_BinarySensor_memory_footprint(record_property):
+    minihass.BinarySensor(name="warmup")
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    sensors = [minihass.BinarySensor(name=f"sensor {i}") for i in range(100)]
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    per_entity = (after - before) // len(sensors)
+    record_property("bytes_per_entity", per_entity)
+    assert per_entity < 1400
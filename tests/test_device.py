@@ -1,3 +1,4 @@
+import os
 from unittest.mock import Mock, PropertyMock, patch
 
 import pytest
@@ -89,6 +90,16 @@ def test_Device_delete_entity(device, entities):
     device.mqtt_client.publish.assert_called_with(expected_topic, "", True, 1)
 
 
+def test_Device_delete_entity_by_object_id(device, entities):
+    device.add_entity(entities[0])
+    device.add_entity(entities[1])
+    assert device.delete_entity("foo1337d00d")
+    assert device.delete_entity("bar")  # Chip ID suffix omitted
+    assert not device.delete_entity("foo1337d00d")
+    assert not device.delete_entity(None)
+    assert len(device) == 0
+
+
 def test_Device_announce(entities, mqtt_client):
     o = minihass.Device(
         entities=entities,
@@ -96,7 +107,7 @@ def test_Device_announce(entities, mqtt_client):
         hw_version="0.1",
         manufacturer="Genericor",
     )
-    assert entities[1] in o._entities
+    assert entities[1] in o
     expected_topic = (
         "homeassistant/binary_sensor/mqtt_device1337d00d/baz1337d00d/config"
     )
@@ -130,7 +141,12 @@ def test_Device_publish_state_queue(entities, mqtt_client):
     mqtt_client.reset_mock()
     mqtt_client.publish.side_effect = None
     o.publish_state_queue()
-    assert mqtt_client.publish.call_count == len(entities)
+    mqtt_client.publish.assert_called_once_with(
+        "homeassistant/device/mqtt_device1337d00d/state",
+        '{"foo1337d00d": true, "bar1337d00d": true, "baz1337d00d": true}',
+        True,
+        1,
+    )
     mqtt_client.reset_mock()
     o.publish_state_queue()
     mqtt_client.publish.assert_not_called()
@@ -163,3 +179,505 @@ def test_Device_mqtt_on_connect_cb_error(logger, device):
     logger.assert_called_with(
         "MQTT client connection error: Connection Refused - Incorrect Protocol Version"
     )
+
+
+def test_Device_batch_states(entities, mqtt_client):
+    o = minihass.Device(entities=entities, mqtt_client=mqtt_client, batch_states=True)
+    mqtt_client.reset_mock()
+    entities[0].state = True
+    entities[1].state = False
+    mqtt_client.publish.assert_not_called()
+    assert o.flush_states()
+    mqtt_client.publish.assert_called_once_with(
+        "homeassistant/device/mqtt_device1337d00d/state",
+        '{"foo1337d00d": true, "bar1337d00d": false}',
+        True,
+        1,
+    )
+    mqtt_client.reset_mock()
+    assert not o.flush_states()
+    entities[2].state = True
+    o.flush_states()
+    mqtt_client.publish.assert_called_once_with(
+        "homeassistant/device/mqtt_device1337d00d/state",
+        '{"foo1337d00d": true, "bar1337d00d": false, "baz1337d00d": true}',
+        True,
+        1,
+    )
+
+
+def test_Device_batch_states_delete_entity(entities, mqtt_client):
+    o = minihass.Device(entities=entities, mqtt_client=mqtt_client, batch_states=True)
+    entities[0].state = True
+    assert o.flush_states()
+    entities[0].state = False  # Pending when deleted
+    entities[2].state = True
+    assert o.delete_entity(entities[0])
+    mqtt_client.reset_mock()
+    assert o.flush_states()
+    mqtt_client.publish.assert_called_once_with(
+        "homeassistant/device/mqtt_device1337d00d/state",
+        '{"baz1337d00d": true}',
+        True,
+        1,
+    )
+
+
+@patch("minihass.device.monotonic")
+def test_Device_batch_interval(monotonic, entities, mqtt_client):
+    monotonic.return_value = 0
+    o = minihass.Device(
+        entities=entities, mqtt_client=mqtt_client, batch_states=True, batch_interval=5
+    )
+    mqtt_client.reset_mock()
+    entities[0].state = True
+    mqtt_client.publish.assert_not_called()
+    monotonic.return_value = 5
+    entities[1].state = True
+    mqtt_client.publish.assert_called_once_with(
+        "homeassistant/device/mqtt_device1337d00d/state",
+        '{"foo1337d00d": true, "bar1337d00d": true}',
+        True,
+        1,
+    )
+
+
+def test_Device_batch_publish_failure(entities, mqtt_client):
+    o = minihass.Device(entities=entities, mqtt_client=mqtt_client, batch_states=True)
+    entities[0].state = True
+    mqtt_client.publish.side_effect = MMQTTException("something failed")
+    assert not o.flush_states()
+    mqtt_client.publish.side_effect = None
+    mqtt_client.reset_mock()
+    assert o.publish_state_queue()
+    mqtt_client.publish.assert_called_once_with(
+        "homeassistant/device/mqtt_device1337d00d/state",
+        '{"foo1337d00d": true}',
+        True,
+        1,
+    )
+
+
+def test_Device_announce_device_discovery(entities, mqtt_client):
+    o = minihass.Device(
+        entities=entities[:2], mqtt_client=mqtt_client, discovery="device"
+    )
+    mqtt_client.reset_mock()
+    expected_topic = "homeassistant/device/mqtt_device1337d00d/config"
+    expected_msg = '{"dev": {"ids": ["mqtt_device1337d00d"], "cns": []}, "o": {"name": "minihass", "sw": "0.1.0"}, "cmps": {"foo1337d00d": {"p": "binary_sensor", "avty": [{"t": "homeassistant/binary_sensor/foo1337d00d/availability"}, {"t": "homeassistant/device/mqtt_device1337d00d/availability"}], "en": true, "unique_id": "foo1337d00d", "name": "foo", "stat_t": "homeassistant/device/mqtt_device1337d00d/state", "val_tpl": "{{ value_json.foo1337d00d }}", "force_update": false, "pl_off": false, "pl_on": true}, "bar1337d00d": {"p": "binary_sensor", "avty": [{"t": "homeassistant/binary_sensor/bar1337d00d/availability"}, {"t": "homeassistant/device/mqtt_device1337d00d/availability"}], "en": true, "unique_id": "bar1337d00d", "name": "bar", "stat_t": "homeassistant/device/mqtt_device1337d00d/state", "val_tpl": "{{ value_json.bar1337d00d }}", "force_update": false, "pl_off": false, "pl_on": true}}}'
+    assert o.announce()
+    mqtt_client.publish.assert_called_once_with(expected_topic, expected_msg, True, 1)
+
+
+def test_Device_delete_entity_device_discovery(entities, mqtt_client):
+    o = minihass.Device(
+        entities=entities[:2], mqtt_client=mqtt_client, discovery="device"
+    )
+    mqtt_client.reset_mock()
+    assert o.delete_entity(entities[0])
+    topic, msg, retain, qos = mqtt_client.publish.call_args.args
+    assert topic == "homeassistant/device/mqtt_device1337d00d/config"
+    assert '"foo1337d00d": {"p": "binary_sensor"}' in msg
+    assert '"bar1337d00d": {"p": "binary_sensor", "avty"' in msg
+    assert entities[0].device is None
+
+
+@patch("adafruit_logging.Logger.error")
+def test_Device_announce_device_discovery_failure(logger, device, entities):
+    device.discovery = "device"
+    device.mqtt_client.publish.side_effect = MMQTTException("something broke")
+    device.add_entity(entities[0])
+    assert not device.announce()
+    logger.assert_called_with("Announcement failed, ('something broke',)")
+
+
+@patch("minihass.device.dumps")
+def test_Device_discovery_cache(dumps, entities, mqtt_client):
+    dumps.return_value = "{}"
+    o = minihass.Device(entities=entities, mqtt_client=mqtt_client, discovery="device")
+    dumps.reset_mock()
+    o.announce()
+    o.announce()
+    dumps.assert_not_called()  # Cached when the entities were added
+    entities[0].name = "renamed"
+    o.announce()
+    o.announce()
+    assert dumps.call_count == 1
+
+
+def test_Device_skip_unchanged(entities, mqtt_client):
+    o = minihass.Device(entities=entities, mqtt_client=mqtt_client, skip_unchanged=True)
+    mqtt_client.reset_mock()
+    assert o.announce()
+    mqtt_client.publish.assert_not_called()
+    entities[1].icon = "mdi:alert"
+    o.announce()
+    assert mqtt_client.publish.call_count == 1
+    assert mqtt_client.publish.call_args.args[0].endswith("/bar1337d00d/config")
+    mqtt_client.reset_mock()
+    o.announce(force=True)
+    assert mqtt_client.publish.call_count == len(entities)
+
+
+def test_Device_skip_unchanged_failure_retried(entities, mqtt_client):
+    mqtt_client.publish.side_effect = MMQTTException("something broke")
+    o = minihass.Device(entities=entities, mqtt_client=mqtt_client, skip_unchanged=True)
+    mqtt_client.publish.side_effect = None
+    mqtt_client.reset_mock()
+    assert o.announce()
+    assert mqtt_client.publish.call_count == len(entities)
+
+
+def test_Device_announce_cache_file(entities, mqtt_client, tmp_path):
+    cache = str(tmp_path / "announced.json")
+    minihass.Device(
+        entities=entities,
+        mqtt_client=mqtt_client,
+        skip_unchanged=True,
+        announce_cache_file=cache,
+    )
+    new_entities = [minihass.BinarySensor(name=e.name) for e in entities]
+    mqtt_client.reset_mock()
+    o = minihass.Device(
+        entities=new_entities,
+        mqtt_client=mqtt_client,
+        skip_unchanged=True,
+        announce_cache_file=cache,
+    )
+    o.announce()
+    mqtt_client.publish.assert_not_called()
+
+
+def test_Device_announce_cache_file_queued(entities, mqtt_client, tmp_path):
+    cache = str(tmp_path / "announced.json")
+    mqtt_client.publish.side_effect = MMQTTException("offline")
+    o = minihass.Device(
+        entities=entities,
+        mqtt_client=mqtt_client,
+        skip_unchanged=True,
+        announce_cache_file=cache,
+        flush_max_messages=1,
+    )
+    mqtt_client.publish.side_effect = None
+    o.mqtt_on_connect_cb(mqtt_client, None, {}, 0)  # Discovery stays queued
+    assert any(t.endswith("/config") for t in o.outbox.topics)
+
+    new_entities = [minihass.BinarySensor(name=e.name) for e in entities]
+    mqtt_client.reset_mock()
+    minihass.Device(
+        entities=new_entities,
+        mqtt_client=mqtt_client,
+        skip_unchanged=True,
+        announce_cache_file=cache,
+    )
+    assert mqtt_client.publish.call_count == len(entities)
+
+
+def test_Device_announce_on_birth(entities, mqtt_client):
+    o = minihass.Device(
+        entities=entities, mqtt_client=mqtt_client, announce_on_birth=True
+    )
+    mqtt_client.add_topic_callback.assert_called_with(
+        "homeassistant/status", o.ha_status_cb
+    )
+    mqtt_client.reset_mock()
+    o.mqtt_on_connect_cb(mqtt_client, None, {}, 0)
+    mqtt_client.subscribe.assert_called_with("homeassistant/status", 1)
+    assert mqtt_client.publish.call_count == len(entities) + 1  # + availability
+    mqtt_client.reset_mock()
+    o.mqtt_on_connect_cb(mqtt_client, None, {}, 0)
+    assert mqtt_client.publish.call_count == 1  # Availability only
+    mqtt_client.reset_mock()
+    o.ha_status_cb(mqtt_client, "homeassistant/status", "offline")
+    mqtt_client.publish.assert_not_called()
+    o.ha_status_cb(mqtt_client, "homeassistant/status", "online")
+    assert mqtt_client.publish.call_count == len(entities)
+
+
+def test_Device_defer_states(entities, mqtt_client):
+    o = minihass.Device(entities=entities, mqtt_client=mqtt_client, defer_states=True)
+    mqtt_client.reset_mock()
+    for e in entities:
+        e.state = True
+    mqtt_client.publish.assert_not_called()
+    assert all(e.state_queued for e in entities)
+    assert o.loop() == 1
+    assert mqtt_client.publish.call_count == 1
+    assert not any(e.state_queued for e in entities)
+
+
+@patch("minihass.device.monotonic")
+def test_Device_flush_budget(monotonic, entities, mqtt_client):
+    monotonic.return_value = 0
+    o = minihass.Device(entities=entities, mqtt_client=mqtt_client, defer_states=True)
+    mqtt_client.publish.side_effect = MMQTTException("something failed")
+    o.availability = True
+    entities[0].availability = True
+    mqtt_client.publish.side_effect = None
+    entities[1].state = True
+    mqtt_client.reset_mock()
+    monotonic.side_effect = [0, 0, 0.5, 1.0]
+    assert o.flush(budget=1.0) == 2
+    assert entities[1].state_queued
+    assert len(o.outbox) == 1
+
+
+@patch("adafruit_logging.Logger.warning")
+def test_Device_flush_failure(logger, entities, mqtt_client):
+    o = minihass.Device(entities=entities, mqtt_client=mqtt_client, defer_states=True)
+    for e in entities:
+        e.state = True
+    mqtt_client.publish.side_effect = MMQTTException("something failed")
+    assert o.flush() == 0
+    logger.assert_called_with("Unable to flush state queue, ('something failed',)")
+    assert all(e.state_queued for e in entities)
+
+
+def test_Device_mqtt_on_connect_cb_priority(entities, mqtt_client):
+    o = minihass.Device(entities=entities, mqtt_client=mqtt_client)
+    mqtt_client.publish.side_effect = MMQTTException
+    entities[0].state = True
+    mqtt_client.reset_mock()
+    mqtt_client.publish.side_effect = None
+    o.mqtt_on_connect_cb(mqtt_client, None, {}, 0)
+    topics = [c.args[0] for c in mqtt_client.publish.call_args_list]
+    assert topics[0] == "homeassistant/device/mqtt_device1337d00d/availability"
+    assert topics[1] == "homeassistant/device/mqtt_device1337d00d/state"
+    assert all(t.endswith("/config") for t in topics[2:])
+    assert len(topics) == 2 + len(entities)
+
+
+def test_Device_mqtt_on_connect_cb_budget(entities, mqtt_client):
+    o = minihass.Device(
+        entities=entities, mqtt_client=mqtt_client, flush_max_messages=2
+    )
+    mqtt_client.reset_mock()
+    o.mqtt_on_connect_cb(mqtt_client, None, {}, 0)
+    assert mqtt_client.publish.call_count == 2
+    assert len(o.outbox) == 2
+    mqtt_client.reset_mock()
+    assert o.loop() == 2
+    assert len(o.outbox) == 0
+
+
+def test_Device_flush_max_bytes(entities, mqtt_client):
+    o = minihass.Device(entities=entities, mqtt_client=mqtt_client)
+    mqtt_client.reset_mock()
+    o.announce(queue=True)
+    mqtt_client.publish.assert_not_called()
+    assert o.flush(max_bytes=1) == 1  # At least one message is published
+    assert o.flush(max_bytes=1000) == 2
+
+
+@patch("minihass.ratelimit.monotonic")
+def test_Device_rate_limit(monotonic, entities, mqtt_client):
+    monotonic.return_value = 0
+    o = minihass.Device(entities=entities, mqtt_client=mqtt_client, rate_limit=1)
+    mqtt_client.reset_mock()
+    for e in entities:
+        e.state = True
+    assert mqtt_client.publish.call_count == 1
+    assert o.rate_limiter.throttled == 2
+    assert o.flush() == 0  # Still over the limit
+    monotonic.return_value = 1
+    assert o.flush() == 1
+    mqtt_client.publish.assert_called_with(
+        "homeassistant/device/mqtt_device1337d00d/state",
+        '{"bar1337d00d": true, "baz1337d00d": true}',
+        True,
+        1,
+    )
+
+
+def test_Device_flush_history(mqtt_client):
+    e = minihass.BinarySensor(name="foo", history_bytes=64)
+    o = minihass.Device(entities=[e], mqtt_client=mqtt_client)
+    mqtt_client.publish.side_effect = MMQTTException
+    e.state = True
+    e.state = False
+    mqtt_client.publish.side_effect = None
+    mqtt_client.reset_mock()
+    o.mqtt_on_connect_cb(mqtt_client, None, {}, 0)
+    topic, msg, retain, qos = mqtt_client.publish.call_args.args
+    assert topic == "homeassistant/entity/foo1337d00d/history"
+    assert msg.count("[") == 3  # Two samples
+    assert o.flush_history() == 0
+
+
+def test_Device_file_outbox_reconnect(entities, mqtt_client, tmp_path):
+    path = str(tmp_path / "outbox.log")
+    o = minihass.Device(
+        entities=entities, mqtt_client=mqtt_client, outbox=minihass.FileOutbox(path)
+    )
+    for _ in range(3):
+        o.mqtt_on_connect_cb(mqtt_client, None, {}, 0)
+    o.outbox.sync()
+    assert os.path.getsize(path) == 0  # Availability and discovery not logged
+
+
+def test_Device_file_outbox(entities, mqtt_client, tmp_path):
+    path = str(tmp_path / "outbox.log")
+    o = minihass.Device(
+        entities=entities, mqtt_client=mqtt_client, outbox=minihass.FileOutbox(path)
+    )
+    mqtt_client.publish.side_effect = MMQTTException
+    entities[0].state = True
+    o.outbox.close()
+    # Simulate reboot
+    mqtt_client.publish.side_effect = None
+    new_entities = [minihass.BinarySensor(name=e.name) for e in entities]
+    p = minihass.Device(
+        entities=new_entities, mqtt_client=mqtt_client, outbox=minihass.FileOutbox(path)
+    )
+    assert new_entities[0].state_queued
+    mqtt_client.reset_mock()
+    assert p.publish_state_queue()
+    mqtt_client.publish.assert_called_once_with(
+        "homeassistant/device/mqtt_device1337d00d/state",
+        '{"foo1337d00d": true}',
+        True,
+        1,
+    )
+
+
+def test_Device_short_keys(entities, mqtt_client):
+    o = minihass.Device(entities=entities, mqtt_client=mqtt_client, short_keys=True)
+    assert [e.state_key for e in entities] == ["0", "1", "2"]
+    assert entities[1].discovery_config()["val_tpl"] == "{{ value_json['1'] }}"
+    mqtt_client.reset_mock()
+    entities[1].state = True
+    mqtt_client.publish.assert_called_once_with(
+        "homeassistant/device/mqtt_device1337d00d/state", b'{"1": true}', True, 1
+    )
+    # Keys are kept when an entity is removed and added again
+    o.delete_entity(entities[1])
+    assert entities[1].state_key == "bar1337d00d"
+    o.add_entity(entities[1])
+    assert entities[1].state_key == "1"
+    keys = [o._short_key(minihass.BinarySensor(name=str(n))) for n in range(34)]
+    assert keys[0] == "3" and keys[-2] == "z" and keys[-1] == "10"
+
+
+def test_Device_state_qos_retain(entities, mqtt_client):
+    entities[1] = minihass.BinarySensor(name="bar", state_qos=1, state_retain=True)
+    o = minihass.Device(
+        entities=entities, mqtt_client=mqtt_client, state_qos=0, state_retain=False
+    )
+    topic = "homeassistant/device/mqtt_device1337d00d/state"
+    mqtt_client.reset_mock()
+    entities[0].state = True
+    mqtt_client.publish.assert_called_once_with(
+        topic, b'{"foo1337d00d": true}', False, 0
+    )
+    entities[1].state = True
+    mqtt_client.publish.assert_called_with(topic, b'{"bar1337d00d": true}', True, 1)
+    # Merged documents are retained if any merged state is, with the highest QoS,
+    # and availability keeps safe defaults
+    mqtt_client.publish.side_effect = MMQTTException
+    entities[0].state = False
+    mqtt_client.publish.side_effect = None
+    mqtt_client.reset_mock()
+    o.availability = True
+    o.flush()
+    assert mqtt_client.publish.call_args_list[0].args[2:] == (True, 1)
+    mqtt_client.publish.assert_called_with(topic, '{"foo1337d00d": false}', False, 0)
+    mqtt_client.publish.side_effect = MMQTTException
+    entities[0].state = True
+    entities[1].state = False
+    mqtt_client.publish.side_effect = None
+    o.flush()
+    mqtt_client.publish.assert_called_with(
+        topic, '{"foo1337d00d": true, "bar1337d00d": false}', True, 1
+    )
+
+
+def test_Device_state_qos_retain_deferred(mqtt_client):
+    e = minihass.BinarySensor(name="foo", state_qos=0, state_retain=False)
+    o = minihass.Device(entities=[e], mqtt_client=mqtt_client, defer_states=True)
+    mqtt_client.reset_mock()
+    e.state = True
+    o.loop()
+    mqtt_client.publish.assert_called_once_with(
+        "homeassistant/device/mqtt_device1337d00d/state",
+        '{"foo1337d00d": true}',
+        False,
+        0,
+    )
+
+
+def test_Device_registry(entities, mqtt_client):
+    o = minihass.Device(entities=entities, mqtt_client=mqtt_client)
+    assert len(o) == 3
+    assert list(o) == entities
+    assert o["bar1337d00d"] is entities[1]
+    assert o["bar"] is entities[1]
+    assert "baz1337d00d" in o
+    assert o.by_component("binary_sensor") == entities
+    assert o.by_component("sensor") == []
+    with pytest.raises(KeyError):
+        o["qux"]
+    with pytest.raises(ValueError):
+        o.add_entity(minihass.BinarySensor(name="foo"))
+    o.delete_entity(entities[0])
+    assert entities[0] not in o
+    assert o.by_component("binary_sensor") == entities[1:]
+    assert minihass.Device(mqtt_client=mqtt_client)  # Empty devices are truthy
+
+
+def test_Device_pending_states(entities, mqtt_client):
+    idle = minihass.BinarySensor(name="idle", history_bytes=64)
+    busy = minihass.BinarySensor(name="busy", history_bytes=64)
+    o = minihass.Device(entities=entities + [idle, busy], mqtt_client=mqtt_client)
+    assert o.pending_states == 0
+    mqtt_client.publish.side_effect = MMQTTException
+    entities[0].state = True
+    busy.state = True
+    assert o.pending_states == 2
+    assert list(o._history_pending) == ["busy1337d00d"]
+    mqtt_client.publish.side_effect = None
+    assert o.publish_state_queue()
+    assert o.pending_states == 0
+    assert o.flush_history() == 1
+    assert not o._history_pending
+
+
+def test_Device_update_states(entities, mqtt_client):
+    o = minihass.Device(entities=entities, mqtt_client=mqtt_client)
+    mqtt_client.reset_mock()
+    assert o.update_states({entities[0]: True, "bar1337d00d": 0, "baz": 1})
+    mqtt_client.publish.assert_called_once_with(
+        "homeassistant/device/mqtt_device1337d00d/state",
+        '{"foo1337d00d": true, "bar1337d00d": false, "baz1337d00d": true}',
+        True,
+        1,
+    )
+    assert [e.state for e in entities] == [True, False, True]
+
+
+def test_Device_update_states_atomic(entities, mqtt_client):
+    o = minihass.Device(entities=entities[:2], mqtt_client=mqtt_client)
+    mqtt_client.reset_mock()
+    with pytest.raises(KeyError, match="baz1337d00d"):
+        o.update_states({entities[0]: True, entities[2]: True})
+    with pytest.raises(KeyError):
+        o.update_states({entities[0]: True, "qux": True})
+    assert entities[0].state is None
+    mqtt_client.publish.assert_not_called()
+
+
+@patch("adafruit_logging.Logger.warning")
+def test_Device_update_states_failure(logger, entities, mqtt_client):
+    o = minihass.Device(entities=entities, mqtt_client=mqtt_client)
+    mqtt_client.publish.side_effect = MMQTTException("x")
+    assert not o.update_states({"foo": True, "bar": False})
+    logger.assert_called_with("Unable to publish state update, ('x',)")
+    assert o.pending_states == 2
+
+
+@patch("minihass.device.dumps")
+def test_Device_device_discovery_announced_once(dumps, mqtt_client):
+    dumps.return_value = "{}"
+    sensors = [minihass.BinarySensor(name=f"s{i}") for i in range(20)]
+    minihass.Device(entities=sensors, mqtt_client=mqtt_client, discovery="device")
+    assert dumps.call_count == 1
+    assert mqtt_client.publish.call_count == 1
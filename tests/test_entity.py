@@ -88,6 +88,7 @@ def test_Entity_auto_device_id():
     assert o.object_id == "bar1337d00d"
 
 
+@patch.object(minihass.Entity, "_chip_id", None)
 @patch("microcontroller.cpu", spec="")
 def test_Entity_auto_device_id_from_env(m):
     """Test chip ID environement variable from non-circuitpython instances"""
@@ -95,6 +96,7 @@ def test_Entity_auto_device_id_from_env(m):
         assert minihass.Entity.chip_id() == "deadbeef"
 
 
+@patch.object(minihass.Entity, "_chip_id", None)
 @patch("microcontroller.cpu", spec="")
 def test_Entity_auto_device_id_fail(m):
     """Test exception when chip ID can't be discovered"""
@@ -187,7 +189,7 @@ def test_SensorEntity_state_topic(sensor):
 def test_SensorEntity_publish(sensor):
     sensor.state = "foo"
     sensor.mqtt_client.publish.assert_called_with(
-        "homeassistant/entity/test1337d00d/state", '{"test1337d00d": "foo"}', True, 1
+        "homeassistant/entity/test1337d00d/state", b'{"test1337d00d": "foo"}', True, 1
     )
 
 
@@ -200,7 +202,7 @@ def test_SensorEntity_queue(mqtt_client):
     mqtt_client.publish.side_effect = None
     s.publish_state()
     mqtt_client.publish.assert_called_with(
-        "homeassistant/entity/foo1337d00d/state", '{"foo1337d00d": "foo"}', True, 1
+        "homeassistant/entity/foo1337d00d/state", b'{"foo1337d00d": "foo"}', True, 1
     )
     assert not s.state_queued
 
@@ -211,5 +213,173 @@ def test_SensorEntity_always_queue(mqtt_client):
     mqtt_client.publish.assert_not_called()
     s.publish_state()
     mqtt_client.publish.assert_called_with(
-        "homeassistant/entity/foo1337d00d/state", '{"foo1337d00d": "foo"}', True, 1
+        "homeassistant/entity/foo1337d00d/state", b'{"foo1337d00d": "foo"}', True, 1
     )
+
+
+@patch("minihass.entity.dumps")
+def test_Entity_discovery_cache(dumps, entity):
+    """Discovery payload is serialized once and reused until invalidated"""
+    dumps.return_value = "{}"
+    entity.announce()
+    entity.announce()
+    assert dumps.call_count == 1
+    entity.icon = "mdi:alert"
+    entity.announce()
+    assert dumps.call_count == 2
+
+
+def test_Entity_discovery_cache_invalidation(entity):
+    topic, payload = entity.discovery_message()
+    assert entity.discovery_message() is entity.discovery_message()
+    entity.name = "renamed"
+    assert '"name": "renamed"' in entity.discovery_message()[1]
+    entity.device_class = "door"
+    assert '"dev_cla": "door"' in entity.discovery_message()[1]
+    entity.entity_category = "diagnostic"
+    assert '"ent_cat": "diagnostic"' in entity.discovery_message()[1]
+    entity.enabled_by_default = False
+    assert '"en": false' in entity.discovery_message()[1]
+    entity.component_config = {"foo": "bar"}
+    assert entity.discovery_message()[1].endswith('"foo": "bar"}')
+    entity.device = minihass.Device(mqtt_client=entity.mqtt_client)
+    assert entity.discovery_message()[0] != topic
+
+
+def test_SensorEntity_suppress_unchanged(mqtt_client):
+    s = GenericSensor(name="foo", suppress_unchanged=True, mqtt_client=mqtt_client)
+    s.state = "foo"
+    s.state = "foo"
+    assert mqtt_client.publish.call_count == 1
+    s.state = "bar"
+    assert mqtt_client.publish.call_count == 2
+
+
+def test_SensorEntity_suppress_unchanged_failure_retried(mqtt_client):
+    s = GenericSensor(
+        name="foo", suppress_unchanged=True, queue="no", mqtt_client=mqtt_client
+    )
+    mqtt_client.publish.side_effect = MMQTTException("something broke")
+    s.state = "foo"
+    mqtt_client.publish.side_effect = None
+    s.state = "foo"
+    assert mqtt_client.publish.call_count == 2
+    s.state = "foo"
+    assert mqtt_client.publish.call_count == 2
+
+
+def test_SensorEntity_deadband(mqtt_client):
+    s = GenericSensor(name="foo", deadband=0.5, mqtt_client=mqtt_client)
+    s.state = 20.0
+    s.state = 20.4
+    assert mqtt_client.publish.call_count == 1
+    assert s.state == 20.4
+    s.state = 20.6
+    assert mqtt_client.publish.call_count == 2
+
+
+def test_SensorEntity_relative_deadband(mqtt_client):
+    s = GenericSensor(name="foo", relative_deadband=0.1, mqtt_client=mqtt_client)
+    s.state = 100
+    s.state = 109
+    assert mqtt_client.publish.call_count == 1
+    s.state = 111
+    assert mqtt_client.publish.call_count == 2
+
+
+@patch("minihass.entity.monotonic")
+def test_SensorEntity_min_interval(monotonic, mqtt_client):
+    monotonic.return_value = 0
+    s = GenericSensor(name="foo", min_interval=10, mqtt_client=mqtt_client)
+    s.state = 1
+    monotonic.return_value = 5
+    s.state = 2
+    assert mqtt_client.publish.call_count == 1
+    assert s.state_queued
+    monotonic.return_value = 10
+    s.state = 3
+    assert mqtt_client.publish.call_count == 2
+    mqtt_client.publish.assert_called_with(
+        "homeassistant/entity/foo1337d00d/state", b'{"foo1337d00d": 3}', True, 1
+    )
+
+
+@patch("minihass.ratelimit.monotonic")
+def test_SensorEntity_rate_limit(monotonic, mqtt_client):
+    monotonic.return_value = 0
+    s = GenericSensor(name="foo", rate_limit=1, rate_burst=2, mqtt_client=mqtt_client)
+    for n in range(5):
+        s.state = n
+    assert mqtt_client.publish.call_count == 2
+    assert s.state_queued
+    assert s.rate_limiter.throttled == 3
+
+
+def test_SensorEntity_history(mqtt_client):
+    s = GenericSensor(name="foo", history_bytes=64, mqtt_client=mqtt_client)
+    mqtt_client.publish.side_effect = MMQTTException
+    for n in range(3):
+        s.state = n
+    assert len(s.history) == 3
+    mqtt_client.publish.side_effect = None
+    assert s.publish_history()
+    topic, msg, retain, qos = mqtt_client.publish.call_args.args
+    assert topic == "homeassistant/entity/foo1337d00d/history"
+    assert [x[1] for x in __import__("json").loads(msg)] == [0, 1, 2]
+    assert (retain, qos) == (False, 1)
+    assert len(s.history) == 0
+    assert not s.publish_history()
+
+
+@patch("minihass.entity.monotonic")
+def test_SensorEntity_history_only_offline(monotonic, mqtt_client):
+    monotonic.return_value = 0
+    s = GenericSensor(
+        name="foo", history_bytes=64, min_interval=10, mqtt_client=mqtt_client
+    )
+    for n in range(3):
+        s.state = n  # Published or queued while connected
+    assert len(s.history) == 0
+    mqtt_client.is_connected.return_value = False
+    s.state = 3
+    assert len(s.history) == 1
+
+
+def test_Entity_chip_id_cached():
+    """Chip ID is read from the microcontroller only once"""
+    with patch.object(minihass.Entity, "_chip_id", None):
+        assert minihass.Entity.chip_id() == "1337d00d"
+        with patch("microcontroller.cpu", spec=""):
+            assert minihass.Entity.chip_id() == "1337d00d"
+
+
+def test_Entity_topics_follow_device(entity):
+    assert entity.discovery_topic == "homeassistant/generic/foo1337d00d/config"
+    d = minihass.Device(mqtt_client=entity.mqtt_client)
+    entity.device = d
+    assert (
+        entity.discovery_topic
+        == "homeassistant/generic/mqtt_device1337d00d/foo1337d00d/config"
+    )
+    entity.device = None
+    assert entity.discovery_topic == "homeassistant/generic/foo1337d00d/config"
+
+
+def test_SensorEntity_render_state(sensor):
+    assert sensor._render_state(True) is sensor._render_state(True)
+    assert sensor._render_state(None) == b'{"test1337d00d": null}'
+    assert sensor._render_state(21.5) == b'{"test1337d00d": 21.5}'
+    assert sensor._render_state("on") == b'{"test1337d00d": "on"}'
+    assert sensor._render_state(1) == b'{"test1337d00d": 1}'
+
+
+def test_SensorEntity_state_qos_retain(mqtt_client):
+    s = GenericSensor(name="foo", mqtt_client=mqtt_client, state_qos=0)
+    assert (s.state_qos, s.state_retain) == (0, True)
+    s = GenericSensor(name="foo", mqtt_client=mqtt_client, state_retain=False)
+    s.state = 1
+    mqtt_client.publish.assert_called_with(
+        "homeassistant/entity/foo1337d00d/state", b'{"foo1337d00d": 1}', False, 1
+    )
+    with pytest.raises(ValueError):
+        GenericSensor(name="foo", mqtt_client=mqtt_client, state_qos=2)
@@ -0,0 +1,40 @@
+import pytest
+
+from minihass.history import History
+
+
+def test_History_capacity():
+    h = History(80, "f")  # 4-byte timestamp + 4-byte float
+    assert h.capacity == 10
+    assert len(h) == 0
+
+
+def test_History_too_small():
+    with pytest.raises(ValueError):
+        History(4, "f")
+
+
+def test_History_drop_oldest():
+    h = History(24, "f")
+    for n in range(5):
+        h.append(n, timestamp=100 + n)
+    assert list(h) == [(102, 2.0), (103, 3.0), (104, 4.0)]
+    assert h.dropped == 2
+
+
+def test_History_drop_newest():
+    h = History(24, "i", policy="drop_newest")
+    assert h.append(1, timestamp=1)
+    h.append(2, timestamp=2)
+    h.append(3, timestamp=3)
+    assert not h.append(4, timestamp=4)
+    assert list(h) == [(1, 1), (2, 2), (3, 3)]
+    assert h.dropped == 1
+
+
+def test_History_clear():
+    h = History(24, "b")
+    h.append(True)
+    h.clear()
+    assert len(h) == 0
+    assert list(h) == []
@@ -0,0 +1,55 @@
+from unittest.mock import patch
+
+import adafruit_logging as logging
+
+from minihass import _logging
+
+
+class Formatted:
+    """Counts how many times it is converted to a string"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __str__(self):
+        self.count += 1
+        return "formatted"
+
+
+def test_getLogger_sets_level_once():
+    logger = _logging.getLogger("test_once")
+    assert logger.getEffectiveLevel() == logging.WARNING
+    logger.setLevel(logging.DEBUG)
+    assert _logging.getLogger("test_once") is logger
+    assert logger.getEffectiveLevel() == logging.DEBUG
+
+
+@patch("adafruit_logging.Logger.debug")
+def test_Logger_no_formatting_below_level(debug):
+    logger = _logging.getLogger("test_lazy")
+    logger.setLevel(logging.WARNING)
+    arg = Formatted()
+    logger.debug("Value: %s", arg)
+    logger.info("Value: %s", arg)
+    assert arg.count == 0
+    debug.assert_not_called()
+    assert not logger.isEnabledFor(logging.DEBUG)
+
+
+@patch("adafruit_logging.Logger.debug")
+def test_Logger_formats_at_level(debug):
+    logger = _logging.getLogger("test_enabled")
+    logger.setLevel(logging.DEBUG)
+    logger.debug("Value: %s", Formatted())
+    debug.assert_called_with("Value: formatted")
+    assert logger.isEnabledFor(logging.DEBUG)
+
+
+@patch("adafruit_logging.Logger.debug")
+@patch("minihass._logging.DEBUG_LOGGING", False)
+def test_Logger_debug_stripped(debug):
+    logger = _logging.getLogger("test_stripped")
+    logger.setLevel(logging.DEBUG)
+    logger.debug("Value: %s", Formatted())
+    debug.assert_not_called()
+    assert not logger.isEnabledFor(logging.DEBUG)
@@ -0,0 +1,117 @@
+from unittest.mock import Mock, patch
+
+import pytest
+
+import minihass
+from minihass.loopback import (
+    LoopbackBroker,
+    LoopbackTransport,
+    publish_size,
+    topic_matches,
+)
+
+
+@pytest.mark.parametrize(
+    "f, t, x",
+    [
+        ("a/b", "a/b", True),
+        ("a/+", "a/b", True),
+        ("a/+", "a/b/c", False),
+        ("a/#", "a", True),
+        ("a/#", "a/b/c", True),
+        ("+/b", "a/c", False),
+        ("a/b/c", "a/b", False),
+    ],
+)
+def test_topic_matches(f, t, x):
+    assert topic_matches(f, t) == x
+
+
+def test_LoopbackTransport_retain():
+    broker = LoopbackBroker()
+    t = LoopbackTransport(broker)
+    t.connect()
+    t.publish("a/b", "x", True, 1)
+    t.publish("a/c", "y")
+    assert broker.retained == {"a/b": "x"}
+    cb = Mock()
+    u = LoopbackTransport(broker)
+    u.add_topic_callback("a/+", cb)
+    u.connect()
+    u.subscribe("a/+")
+    cb.assert_called_once_with(u, "a/b", "x")
+    t.publish("a/b", "", True)
+    assert broker.retained == {}
+
+
+def test_Device_with_LoopbackTransport():
+    broker = LoopbackBroker()
+    t = LoopbackTransport(broker)
+    e = minihass.BinarySensor(name="foo")
+    o = minihass.Device(mqtt_client=t, entities=[e], announce_on_birth=True)
+    e.state = True  # Not connected, queued
+    t.connect()
+    assert broker.retained["homeassistant/device/mqtt_device1337d00d/state"] == (
+        '{"foo1337d00d": true}'
+    )
+    topic = "homeassistant/binary_sensor/mqtt_device1337d00d/foo1337d00d/config"
+    del broker.retained[topic]
+    broker.publish("homeassistant/status", "online")  # Home Assistant birth
+    assert topic in broker.retained
+
+
+@patch("adafruit_logging.Logger.error")
+def test_LoopbackTransport_failure(logger):
+    o = minihass.Device(mqtt_client=LoopbackTransport())
+    o.availability = True
+    logger.assert_called_with(
+        "Availability publishing failed, ('Not connected to the loopback broker',)"
+    )
+
+
+def test_publish_size():
+    # Fixed header, remaining length, topic length, topic, payload
+    assert publish_size("a/b", "on") == 1 + 1 + 2 + 3 + 2
+    # Packet ID and PUBACK
+    assert publish_size("a/b", b"on", 1) == 1 + 1 + 2 + 3 + 2 + 2 + 4
+    assert publish_size("a", "x" * 200) == 1 + 2 + 2 + 1 + 200
+
+
+def test_LoopbackBroker_qos_and_stats():
+    broker = LoopbackBroker()
+    sub = LoopbackTransport(broker, record=True)
+    sub.connect()
+    sub.subscribe("a/#", 0)
+    pub = LoopbackTransport(broker)
+    pub.connect()
+    pub.publish("a/b", "x", False, 1)
+    assert sub.received == [("a/b", "x", 0)]
+    sub.subscribe("a/#", 1)
+    pub.publish("a/b", b"y", False, 1)
+    assert sub.received[-1] == ("a/b", "y", 1)
+    assert broker.stats == {
+        "published": 2,
+        "delivered": 2,
+        "acks": 2,
+        "wire_bytes": 2 * publish_size("a/b", "x", 1),
+    }
+    broker.reset_stats()
+    assert broker.stats["published"] == 0
+
+
+def test_LoopbackTransport_will():
+    broker = LoopbackBroker()
+    t = LoopbackTransport(broker)
+    t.will_set("a/status", "offline", 1, True)
+    t.connect()
+    assert t.is_connected()
+    t.subscribe("a/#")
+    t.disconnect()
+    assert not t.is_connected()
+    assert "a/status" not in broker.retained
+    assert not broker._subscriptions
+    t.connect()
+    t.disconnect(clean=False)
+    assert broker.retained["a/status"] == "offline"
+    with pytest.raises(minihass.TransportError):
+        t.publish("a/b", "x")
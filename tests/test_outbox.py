@@ -0,0 +1,172 @@
+import os
+from unittest.mock import patch
+
+import pytest
+
+import minihass
+from minihass.outbox import FileOutbox, Outbox
+
+
+@pytest.fixture
+def outbox():
+    yield Outbox()
+
+
+def test_Outbox_put_latest_wins(outbox):
+    outbox.put("foo/availability", "online")
+    outbox.put("foo/availability", "offline")
+    assert len(outbox) == 1
+    assert outbox.get("foo/availability") == "offline"
+
+
+def test_Outbox_merge(outbox):
+    outbox.merge("foo/state", {"a": 1})
+    outbox.merge("foo/state", {"b": 2})
+    outbox.merge("foo/state", {"a": 3})
+    assert len(outbox) == 1
+    assert outbox.get("foo/state") == {"a": 3, "b": 2}
+    assert outbox.pending("foo/state", "b")
+    assert not outbox.pending("foo/state", "c")
+
+
+def test_Outbox_merge_flags(outbox):
+    outbox.merge("foo/state", {"a": 1}, retain=False, qos=0)
+    assert outbox.flags("foo/state") == (False, 0)
+    outbox.merge("foo/state", {"b": 2}, retain=True, qos=1)
+    outbox.merge("foo/state", {"c": 3}, retain=False, qos=0)
+    assert outbox.flags("foo/state") == (True, 1)
+
+
+def test_Outbox_discard_key(outbox):
+    outbox.merge("foo/state", {"a": 1, "b": 2})
+    outbox.discard("foo/state", "a")
+    assert outbox.get("foo/state") == {"b": 2}
+    outbox.discard("foo/state", "b")
+    assert "foo/state" not in outbox
+
+
+def test_Outbox_priority(outbox):
+    outbox.put("foo/config", "{}", priority=minihass.const.PRIORITY_DISCOVERY)
+    outbox.merge("foo/state", {"a": 1})
+    outbox.put("foo/availability", "online", priority=0)
+    assert outbox.topics == ["foo/availability", "foo/state", "foo/config"]
+
+
+def test_FileOutbox_replay(tmp_path):
+    path = str(tmp_path / "outbox.log")
+    o = FileOutbox(path)
+    o.merge("foo/state", {"a": 1})
+    o.merge("foo/state", {"b": 2})
+    o.put("foo/availability", "online", priority=0)
+    o.put("foo/config", "{}")
+    o.discard("foo/config")
+    o.close()
+    p = FileOutbox(path)
+    assert p.topics == ["foo/state"]  # Availability isn't persisted
+    assert p.get("foo/state") == {"a": 1, "b": 2}
+    p.close()
+
+
+def test_FileOutbox_discard(tmp_path):
+    path = str(tmp_path / "outbox.log")
+    o = FileOutbox(path)
+    o.put("foo/state", "on")
+    o.discard("foo/state")
+    o.close()
+    assert len(FileOutbox(path)) == 0
+
+
+def test_FileOutbox_truncated_record(tmp_path):
+    path = str(tmp_path / "outbox.log")
+    o = FileOutbox(path)
+    o.put("foo/availability", "online")
+    o.close()
+    with open(path, "a") as f:
+        f.write('["p", "foo/st')
+    assert FileOutbox(path).topics == ["foo/availability"]
+
+
+def test_FileOutbox_compaction(tmp_path):
+    path = str(tmp_path / "outbox.log")
+    o = FileOutbox(path, sync_every=2, compact_after=10)
+    for n in range(25):
+        o.merge("foo/state", {"a": n})
+    o.close()
+    with open(path) as f:
+        assert len(f.readlines()) <= 10
+    assert FileOutbox(path).get("foo/state") == {"a": 24}
+
+
+def test_FileOutbox_boot_compaction(tmp_path):
+    path = str(tmp_path / "outbox.log")
+    o = FileOutbox(path, compact_after=10)
+    for n in range(3):
+        o.merge("foo/state", {"a": n})
+    o.close()
+    p = FileOutbox(path, compact_after=10)  # Small log, appended to as is
+    p.merge("foo/state", {"a": 3})
+    p.close()
+    with open(path) as f:
+        assert len(f.readlines()) == 4
+    for n in range(4, 10):
+        o = FileOutbox(path, compact_after=10)
+        o.merge("foo/state", {"a": n})
+        o.close()
+    o = FileOutbox(path, compact_after=10)  # Compacted once the log is large
+    o.close()
+    with open(path) as f:
+        assert len(f.readlines()) == 1
+    assert FileOutbox(path).get("foo/state") == {"a": 9}
+
+
+def test_FileOutbox_compaction_atomic(tmp_path):
+    path = str(tmp_path / "outbox.log")
+    o = FileOutbox(path)
+    o.put("foo/availability", "online")
+    o.sync()
+    with patch("minihass.outbox.dumps", side_effect=RuntimeError("power loss")):
+        with pytest.raises(RuntimeError):
+            o.compact()  # Interrupted while writing the compacted log
+    assert FileOutbox(path).topics == ["foo/availability"]
+
+
+def test_FileOutbox_missing_newline(tmp_path):
+    path = str(tmp_path / "outbox.log")
+    with open(path, "w") as f:
+        f.write('["p", "foo/state", "on", true, 1, 1]')
+    o = FileOutbox(path)
+    o.put("bar/state", "off")
+    o.close()
+    assert FileOutbox(path).topics == ["foo/state", "bar/state"]
+
+
+def test_FileOutbox_compaction_fat(tmp_path):
+    path = str(tmp_path / "outbox.log")
+    o = FileOutbox(path)
+    o.put("foo/availability", "online")
+    calls = []
+
+    def fat_rename(src, dst):
+        calls.append(dst)
+        if os.path.exists(dst):
+            raise OSError(17)
+        os.rename(src, dst)
+
+    with patch("minihass.outbox.rename", fat_rename):
+        o.compact()  # Retried once the log is removed
+    assert len(calls) == 2
+    o.close()
+    assert FileOutbox(path).topics == ["foo/availability"]
+
+
+def test_FileOutbox_state_only(tmp_path):
+    path = str(tmp_path / "outbox.log")
+    o = FileOutbox(path)
+    o.put("foo/state", "on")
+    o.put("foo/state", "{}", priority=minihass.const.PRIORITY_DISCOVERY)
+    o.put("foo/availability", "online", priority=minihass.const.PRIORITY_AVAILABILITY)
+    o.discard("foo/availability")
+    o.close()
+    with open(path) as f:
+        assert len(f.readlines()) == 2  # The state, then its removal
+    assert len(FileOutbox(path)) == 0
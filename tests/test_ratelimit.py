@@ -0,0 +1,28 @@
+from unittest.mock import patch
+
+import pytest
+
+from minihass.ratelimit import TokenBucket
+
+
+@patch("minihass.ratelimit.monotonic")
+def test_TokenBucket(monotonic):
+    monotonic.return_value = 0
+    b = TokenBucket(rate=2, burst=2)
+    assert b.consume()
+    assert b.consume()
+    assert not b.consume()
+    assert b.throttled == 1
+    monotonic.return_value = 0.5
+    assert b.consume()
+    assert not b.ready()
+    monotonic.return_value = 10
+    assert b.consume()
+    assert b.consume()
+    assert not b.consume()  # Capacity capped at burst
+
+
+@pytest.mark.parametrize("rate, burst", [(0, 1), (-1, 1), (1, 0)])
+def test_TokenBucket_invalid(rate, burst):
+    with pytest.raises(ValueError):
+        TokenBucket(rate, burst)
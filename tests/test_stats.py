@@ -0,0 +1,99 @@
+import tracemalloc
+from unittest.mock import Mock, PropertyMock
+
+import pytest
+from adafruit_minimqtt.adafruit_minimqtt import MQTT, MMQTTException
+
+import minihass
+
+
+@pytest.fixture
+def entities():
+    yield [minihass.BinarySensor(name="foo"), minihass.BinarySensor(name="bar")]
+
+
+@pytest.fixture
+def mqtt_client():
+    mqtt_client = Mock(spec=MQTT)
+    mqtt_client.broker = PropertyMock(return_value="broker.example.com")
+    yield mqtt_client
+
+
+def test_Stats_disabled(mqtt_client):
+    o = minihass.Device(mqtt_client=mqtt_client)
+    assert o.stats is None
+    assert o.mqtt_client is mqtt_client
+
+
+def test_Stats_counters(entities, mqtt_client):
+    o = minihass.Device(mqtt_client=mqtt_client, entities=entities, stats=True)
+    assert mqtt_client.on_connect == o.mqtt_on_connect_cb  # Forwarded by wrapper
+    stats = o.stats
+    assert stats.publishes == 2  # Announcements
+    stats.reset()
+
+    entities[0].state = True
+    assert stats.publishes == 1
+    assert stats.bytes_sent == len(o.state_topic) + len(b'{"foo1337d00d": true}')
+
+    mqtt_client.publish.side_effect = MMQTTException
+    entities[1].state = True
+    assert stats.failures == 1
+    assert stats.queue_depth == 1
+    mqtt_client.publish.side_effect = None
+    o.flush()
+    assert stats.max_queue_depth == 1
+    assert stats.queue_depth == 0
+
+    o.announce()
+    o.announce()
+    assert (stats.announces, stats.reannounces) == (2, 4)
+    assert stats.as_dict()["publishes"] == 6
+
+
+def test_Stats_reannounces_skip_unchanged(entities, mqtt_client):
+    o = minihass.Device(
+        mqtt_client=mqtt_client, entities=entities, stats=True, skip_unchanged=True
+    )
+    for _ in range(3):
+        o.mqtt_on_connect_cb(mqtt_client, None, {}, 0)
+    assert o.stats.announces == 3
+    assert o.stats.reannounces == 0  # Nothing was republished
+    entities[0].name = "renamed"
+    o.mqtt_on_connect_cb(mqtt_client, None, {}, 0)
+    assert o.stats.reannounces == 1
+
+
+def test_Stats_allocations(entities, mqtt_client):
+    o = minihass.Device(mqtt_client=mqtt_client, entities=entities, stats=True)
+    entities[0].state = True
+    assert o.stats.allocations == {}  # Not tracing
+    tracemalloc.start()
+    try:
+        entities[0].state = 1.5
+        o.announce()
+        start = o.stats.start()
+        minihass.BinarySensor(name="baz")
+        o.stats.record("entity_init", start)
+    finally:
+        tracemalloc.stop()
+    assert o.stats.allocations["publish_state"][0] == 1
+    assert o.stats.allocations["announce"][0] == 1
+    assert o.stats.allocated_per_call("entity_init") > 0
+    assert o.stats.allocated_per_call("flush") == 0
+
+
+def test_Stats_allocations_keep_tracemalloc_peak(entities, mqtt_client):
+    o = minihass.Device(mqtt_client=mqtt_client, entities=entities, stats=True)
+    tracemalloc.start()
+    try:
+        block = bytearray(100000)
+        del block
+        outer = o.stats.start()
+        o.announce()  # Measured inside the outer measurement
+        o.stats.record("outer", outer)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert peak >= 100000
+    assert o.stats.allocations["outer"][1] >= o.stats.allocations["announce"][1]
@@ -0,0 +1,43 @@
+from unittest.mock import Mock
+
+import pytest
+from adafruit_minimqtt.adafruit_minimqtt import MQTT, MMQTTException
+
+import minihass
+from minihass.paho import PahoTransport
+from minihass.transport import MiniMQTTTransport
+
+
+def test_TransportError_is_MMQTTException():
+    assert issubclass(minihass.TransportError, MMQTTException)
+
+
+def test_MiniMQTTTransport():
+    client = Mock(spec=MQTT)
+    t = MiniMQTTTransport(client)
+    t.on_connect = cb = Mock()
+    assert client.on_connect is cb
+    t.publish("a", "b", True, 1)
+    client.publish.assert_called_once_with("a", "b", True, 1)
+    client.is_connected.side_effect = MMQTTException("MiniMQTT is not connected.")
+    assert not t.is_connected()
+
+
+def test_PahoTransport():
+    client = Mock()
+    t = PahoTransport(client)
+    client.publish.return_value.rc = 0
+    t.publish("a", "b", True, 1)
+    client.publish.assert_called_once_with("a", "b", 1, True)  # paho order
+    client.publish.return_value.rc = 4
+    with pytest.raises(minihass.TransportError):
+        t.publish("a", "b")
+
+    t.on_connect = cb = Mock()
+    client.on_connect(client, None, {}, 0)
+    cb.assert_called_once_with(t, None, {}, 0)
+
+    t.add_topic_callback("a/b", cb)
+    topic, handler = client.message_callback_add.call_args.args
+    handler(client, None, Mock(topic="a/b", payload=b"online"))
+    cb.assert_called_with(t, "a/b", "online")
@@ -124,3 +124,35 @@ def test_validate_queue_option(n, x):
 def test_validate_queue_option_strict():
     with pytest.raises(ValueError):
         validators.validate_queue_option("foo", strict=True)
+
+
+@pytest.mark.parametrize("n, x", [("entity", "entity"), ("DEVICE", "device")])
+def test_validate_discovery_mode(n, x):
+    assert validators.validate_discovery_mode(n) == x
+
+
+@pytest.mark.parametrize("n", ["foo", "Device", None])
+def test_validate_discovery_mode_strict(n):
+    with pytest.raises(ValueError):
+        validators.validate_discovery_mode(n, strict=True)
+
+
+@pytest.mark.parametrize("n", ["drop_oldest", "drop_newest"])
+def test_validate_history_policy(n):
+    assert validators.validate_history_policy(n) == n
+
+
+def test_validate_history_policy_valueerror():
+    with pytest.raises(ValueError):
+        validators.validate_history_policy("drop_all")
+
+
+@pytest.mark.parametrize("n", [0, 1])
+def test_validate_qos(n):
+    assert validators.validate_qos(n) == n
+
+
+@pytest.mark.parametrize("n", [2, -1, True, "1", None])
+def test_validate_qos_valueerror(n):
+    with pytest.raises(ValueError):
+        validators.validate_qos(n)